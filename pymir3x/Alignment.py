@@ -0,0 +1,218 @@
+"""
+Alignment.py
+Dynamic time warping (DTW) of feature sequences, e.g. frame-level chroma or MFCC
+- Cosine cost between sequences, computed one block of rows at a time
+- Sakoe-Chiba band constraint
+- Multiscale (coarse-to-fine) DTW
+
+The cost and accumulated cost matrices are never materialized. The DP runs one
+row at a time over that row's allowed column window, so memory is one uint8
+backpointer per cell inside the window plus a few rows of floats. Without a
+window every cell is inside it, so unrestricted DTW is refused above
+MAX_FULL_CELLS cells; long sequences go through bandedDtw or multiscaleDtw.
+"""
+
+import numpy
+
+# Largest n * m for DTW without a window (one byte of backpointers per cell)
+MAX_FULL_CELLS = 2 ** 26
+
+
+def _normalizeRows(features):
+    features = numpy.array(features, dtype=numpy.float64, ndmin=2)
+    norms = numpy.sqrt(numpy.einsum('ij,ij->i', features, features))
+    norms[norms == 0] = 1
+    return features / norms[:, None]
+
+
+def cosineCost(x, y):
+    """
+    Compute the cosine distance 1 - cos(x_i, y_j) between every row of x and
+    every row of y. Only use this for blocks; alignment never builds the full matrix.
+    """
+    return 1.0 - numpy.dot(_normalizeRows(x), _normalizeRows(y).T)
+
+
+def bandWindows(n, m, radius):
+    """
+    Compute the Sakoe-Chiba band for sequences of lengths n and m: row i may
+    visit columns [start[i], end[i]) within radius columns of the diagonal.
+    """
+    centre = numpy.arange(n) * (m - 1) / float(max(n - 1, 1))
+    start = numpy.clip(numpy.floor(centre - radius), 0, m - 1).astype(int)
+    end = numpy.clip(numpy.ceil(centre + radius) + 1, 1, m).astype(int)
+    return start, end
+
+
+def _pathWindows(path, n, m, radius):
+    """
+    Compute per-row column windows covering a path (projected from a coarser
+    level), widened by radius cells in every direction.
+    """
+    rows, columns = path
+    start = numpy.full(n, m, dtype=int)
+    end = numpy.zeros(n, dtype=int)
+    numpy.minimum.at(start, rows, columns)
+    numpy.maximum.at(end, rows, columns + 1)
+
+    # Widen the window along both axes
+    widened_start = start.copy()
+    widened_end = end.copy()
+    for offset in range(1, radius + 1):
+        widened_start[offset:] = numpy.minimum(widened_start[offset:], start[:-offset])
+        widened_start[:-offset] = numpy.minimum(widened_start[:-offset], start[offset:])
+        widened_end[offset:] = numpy.maximum(widened_end[offset:], end[:-offset])
+        widened_end[:-offset] = numpy.maximum(widened_end[:-offset], end[offset:])
+
+    start = numpy.clip(widened_start - radius, 0, m - 1)
+    end = numpy.clip(widened_end + radius, 1, m)
+    return start, end
+
+
+def _makeMonotone(start, end):
+    """
+    Make the windows monotone and connected, so that every row overlaps the previous one.
+    """
+    m = end.max()
+    start = numpy.minimum.accumulate(start[::-1])[::-1]
+    end = numpy.maximum.accumulate(end)
+    start[0] = 0
+    end[-1] = m
+    start[1:] = numpy.minimum(start[1:], end[:-1])
+    return start, end
+
+
+def dtw(x, y, start=None, end=None, block_size=256):
+    """
+    Align the feature sequences x (n, d) and y (m, d) with DTW restricted to the
+    column windows [start[i], end[i]) of every row (the full matrix if omitted).
+    Steps are diagonal, vertical and horizontal with unit weights.
+    Cosine costs are computed block_size rows at a time. The horizontal recursion
+    within a row, D[i, j] = min(T[j], c[j] + D[i, j - 1]), is solved for the whole
+    row at once as S[j] + min_{k <= j}(T[k] - S[k]) with S the cumulative row cost.
+    Without windows, n * m may not exceed MAX_FULL_CELLS.
+    Returns (path_rows, path_columns, total_cost).
+    """
+    x = _normalizeRows(x)
+    y = _normalizeRows(y)
+    n, m = len(x), len(y)
+
+    if start is None:
+        if n * m > MAX_FULL_CELLS:
+            raise ValueError("Unrestricted DTW of %d x %d frames needs %d MB of backpointers; "
+                             "use bandedDtw or multiscaleDtw for long sequences" % (n, m, n * m // 2 ** 20))
+        start = numpy.zeros(n, dtype=int)
+        end = numpy.full(n, m, dtype=int)
+    start, end = _makeMonotone(numpy.asarray(start, dtype=int), numpy.asarray(end, dtype=int))
+
+    # Backpointers: 0 = diagonal, 1 = vertical, 2 = horizontal
+    offsets = numpy.concatenate(([0], numpy.cumsum(end - start)))
+    pointers = numpy.zeros(offsets[-1], dtype=numpy.uint8)
+
+    previous = None
+    previous_start = previous_end = 0
+    for block_start in range(0, n, block_size):
+        block_end = min(block_start + block_size, n)
+        lo = start[block_start:block_end].min()
+        hi = end[block_start:block_end].max()
+        block_cost = 1.0 - numpy.dot(x[block_start:block_end], y[lo:hi].T)
+
+        for i in range(block_start, block_end):
+            s, e = start[i], end[i]
+            cost = block_cost[i - block_start, s - lo:e - lo]
+            row_pointers = pointers[offsets[i]:offsets[i + 1]]
+
+            if previous is None:
+                candidate = numpy.full(e - s, numpy.inf)
+                candidate[0] = 0
+                row_pointers[:] = 2
+            else:
+                # Accumulated cost of the previous row at columns j (vertical) and j - 1 (diagonal)
+                padded = numpy.full(e - s + 1, numpy.inf)
+                overlap_start = max(s - 1, previous_start)
+                overlap_end = min(e, previous_end)
+                if overlap_end > overlap_start:
+                    padded[overlap_start - s + 1:overlap_end - s + 1] = previous[overlap_start - previous_start:
+                                                                                 overlap_end - previous_start]
+                diagonal = padded[:-1]
+                vertical = padded[1:]
+                row_pointers[:] = numpy.where(vertical < diagonal, 1, 0)
+                candidate = numpy.minimum(diagonal, vertical)
+
+            # T[j] = c[j] + candidate[j]; D[j] = S[j] + min_{k <= j}(T[k] - S[k])
+            cumulative = numpy.cumsum(cost)
+            shifted = candidate + cost - cumulative
+            best = numpy.minimum.accumulate(shifted)
+            current = cumulative + best
+
+            # Compare in the shifted domain, where best is exact: a cell is horizontal only
+            # if an earlier column is strictly better, so ties keep the diagonal/vertical step.
+            # The first column of the window never points left, out of the window.
+            horizontal = best < shifted
+            horizontal[0] = False
+            row_pointers[horizontal] = 2
+
+            previous, previous_start, previous_end = current, s, e
+
+    # Backtrack from the last cell
+    total_cost = previous[-1]
+    i, j = n - 1, m - 1
+    path_rows = [i]
+    path_columns = [j]
+    while i > 0 or j > 0:
+        step = pointers[offsets[i] + j - start[i]]
+        if step == 0:
+            i, j = i - 1, j - 1
+        elif step == 1:
+            i = i - 1
+        else:
+            j = j - 1
+        path_rows.append(i)
+        path_columns.append(j)
+
+    return numpy.array(path_rows[::-1]), numpy.array(path_columns[::-1]), total_cost
+
+
+def bandedDtw(x, y, radius=None, block_size=256):
+    """
+    Align x and y with DTW constrained to a Sakoe-Chiba band of the given radius
+    (in frames of y, default 10% of the longer sequence).
+    """
+    n, m = len(x), len(y)
+    if radius is None:
+        radius = max(1, max(n, m) // 10)
+
+    start, end = bandWindows(n, m, radius)
+    return dtw(x, y, start, end, block_size)
+
+
+def _downsample(features, factor):
+    features = numpy.asarray(features, dtype=numpy.float64)
+    n = len(features)
+    starts = numpy.arange(0, n, factor)
+    sums = numpy.add.reduceat(features, starts, axis=0)
+    return sums / numpy.diff(numpy.append(starts, n))[:, None]
+
+
+def multiscaleDtw(x, y, factor=4, radius=4, min_size=256, block_size=256):
+    """
+    Align x and y with coarse-to-fine DTW: the sequences are averaged over factor
+    frames until shorter than min_size, aligned there in full, and the path is
+    projected to each finer level and refined within radius cells of it.
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    if min(len(x), len(y)) <= min_size or factor < 2:
+        return dtw(x, y, block_size=block_size)
+
+    coarse_rows, coarse_columns, _ = multiscaleDtw(_downsample(x, factor), _downsample(y, factor),
+                                                   factor, radius, min_size, block_size)
+
+    # Project every coarse cell onto the factor x factor cells it covers
+    fine_offsets = numpy.arange(factor)
+    rows = (coarse_rows[:, None] * factor + fine_offsets[None, :]).repeat(factor, axis=1).ravel()
+    columns = numpy.tile(coarse_columns[:, None] * factor + fine_offsets[None, :], (1, factor)).ravel()
+    inside = (rows < len(x)) & (columns < len(y))
+
+    start, end = _pathWindows((rows[inside], columns[inside]), len(x), len(y), radius)
+    return dtw(x, y, start, end, block_size)
@@ -0,0 +1,137 @@
+"""
+AsyncAnalysis.py
+asyncio counterparts of opening, decoding and analysing audio, for services
+that must keep their event loop responsive
+- Decoding runs ffmpeg through asyncio subprocess pipes
+- CPU-bound stages (WAV loading, feature extraction) run in a configurable
+  thread or process executor
+- A semaphore limits how many analyses run at once
+
+Cancelling an awaitable kills its ffmpeg process. A stage that has already
+started in an executor runs to completion in the background, but its result
+is discarded and its concurrency slot is released immediately.
+"""
+
+import asyncio
+import concurrent.futures
+import functools
+import math
+import numpy
+import os
+import pyaudio
+
+from pymir3x import AudioFile, Metadata
+
+
+class Analyzer(object):
+    """
+    Run pymir3x analyses from coroutines.
+
+    executor: a concurrent.futures executor for CPU-bound stages. A
+    ProcessPoolExecutor sidesteps the GIL, but stage functions and their
+    arguments must then be picklable (module-level functions, Frames and
+    Spectra are). By default a thread pool with max_concurrency workers is used.
+    max_concurrency: maximum number of decodes and stages running at once.
+    """
+
+    def __init__(self, executor=None, max_concurrency=4):
+        self._owns_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency)
+
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    def _limiter(self):
+        # Created lazily, so that it belongs to the loop the analyzer is used from
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    # Run a CPU-bound function in the executor, e.g.
+    # flux = await analyzer.run(Tempo.onsetStrength, audio_file)
+    async def run(self, function, *args, **kwargs):
+        async with self._limiter():
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    # Open an audio file without blocking the event loop. MP3/M4A files are decoded
+    # by ffmpeg through asyncio pipes; WAV files are loaded in the executor.
+    async def open(self, filename, sample_rate=44100, offset=0.0, duration=None):
+        _, ext = os.path.splitext(filename)
+
+        if ext.endswith('mp3') or ext.endswith('m4a'):
+            # With a duration the length is known up front (ffmpeg may deliver a little less)
+            num_samples = None
+            if duration is not None:
+                num_samples = int(math.ceil(duration * sample_rate))
+
+            async with self._limiter():
+                samples = await decode(AudioFile.ffmpegCommand(filename, sample_rate, offset, duration, 'f32le'),
+                                       num_samples=num_samples)
+            return Metadata.wrap(samples.reshape(-1), AudioFile,
+                                 Metadata.Metadata(sample_rate, 1, pyaudio.paFloat32))
+
+        return await self.run(AudioFile.open, filename, sample_rate, offset, duration)
+
+    # Open a file and run every stage on it. stages maps a name to a function taking
+    # the AudioFile; returns a dict of name -> result. The stages run concurrently.
+    async def analyze(self, filename, stages, sample_rate=44100, offset=0.0, duration=None):
+        audio_file = await self.open(filename, sample_rate, offset, duration)
+
+        names = list(stages.keys())
+        results = await asyncio.gather(*[self.run(stages[name], audio_file) for name in names])
+        return dict(zip(names, results))
+
+    # Shut down the executor if the analyzer created it
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+async def decode(command, channels=1, num_samples=None, block_samples=2 ** 18):
+    """
+    Run a decoder command that writes little-endian float32 PCM to stdout (see
+    AudioFile.ffmpegCommand with 'f32le') and return its samples as a
+    (num_samples, channels) float32 array. Every block read from the pipe is
+    copied straight into the buffer that becomes the result, preallocated for
+    num_samples when the length is known and otherwise grown in place (as in
+    AudioFile.readPcmFloat32). A partial sample at the end is dropped.
+    The process is killed if the coroutine is cancelled.
+    """
+    process = await asyncio.create_subprocess_exec(*command, stdin=asyncio.subprocess.DEVNULL,
+                                                   stdout=asyncio.subprocess.PIPE,
+                                                   stderr=asyncio.subprocess.DEVNULL)
+    sample_bytes = 4 * channels
+    capacity = num_samples if num_samples else block_samples
+    buffer = numpy.empty(max(1, capacity) * channels, dtype='<f4')
+    filled = 0
+    try:
+        while True:
+            block = await process.stdout.read(sample_bytes * block_samples)
+            if not block:
+                break
+
+            if filled + len(block) > buffer.nbytes:
+                growth = block_samples * channels if num_samples else len(buffer)
+                buffer.resize(max(len(buffer) + growth, (filled + len(block)) // 4 + 1), refcheck=False)
+            buffer.view(numpy.uint8)[filled:filled + len(block)] = numpy.frombuffer(block, dtype=numpy.uint8)
+            filled += len(block)
+
+        await process.wait()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+    num_samples = filled // sample_bytes
+    buffer.resize(num_samples * channels, refcheck=False)
+    return buffer.reshape(num_samples, channels)
@@ -0,0 +1,284 @@
+"""
+AudioDevice.py
+Persistent, non-blocking audio playback and capture
+An AudioSession keeps one audio backend and one full-duplex stream open.
+The backend's callback thread moves audio between the stream and two
+single-producer/single-consumer ring buffers, so play() and read() never
+block on the device:
+- play() queues samples for output
+- read()/readBlock() return captured samples as Frame blocks for streaming analysis
+
+Backends: PyAudioBackend (PortAudio through pyaudio, the default) and
+StubBackend, which has no sound card and is driven manually for testing.
+"""
+
+import threading
+import numpy
+import pyaudio
+
+import pymir3x
+from pymir3x import Metadata
+
+
+class RingBuffer(object):
+    """
+    Single-producer/single-consumer ring buffer of float32 samples.
+    The producer only advances the write index and the consumer only advances
+    the read index, so one writer thread and one reader thread need no lock.
+    The indices grow monotonically; positions are taken modulo the capacity.
+    """
+
+    def __init__(self, capacity, channels=1):
+        size = 1
+        while size < capacity:
+            size *= 2
+
+        self.capacity = size
+        self.channels = channels
+        self._data = numpy.zeros((size, channels), dtype=numpy.float32)
+        self._read_index = 0
+        self._write_index = 0
+        self.overruns = 0
+
+    # Number of samples ready to be read
+    def available(self):
+        return self._write_index - self._read_index
+
+    # Number of samples that can be written without overwriting unread data
+    def space(self):
+        return self.capacity - self.available()
+
+    # Producer: write samples (num_samples, channels) or (num_samples,) for mono.
+    # Samples that do not fit are dropped and counted in overruns.
+    # Returns the number of samples written.
+    def write(self, samples):
+        samples = numpy.asarray(samples, dtype=numpy.float32).reshape(-1, self.channels)
+        count = min(len(samples), self.space())
+        self.overruns += len(samples) - count
+
+        start = self._write_index % self.capacity
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:count - first] = samples[first:count]
+
+        self._write_index += count
+        return count
+
+    # Consumer: return views of the next count readable samples (at most two
+    # contiguous pieces) without copying or consuming them. Call advance() when done.
+    def peek(self, count):
+        count = min(count, self.available())
+        start = self._read_index % self.capacity
+        first = min(count, self.capacity - start)
+        if first == count:
+            return [self._data[start:start + count]]
+
+        return [self._data[start:], self._data[:count - first]]
+
+    # Consumer: release count samples returned by peek()
+    def advance(self, count):
+        self._read_index += min(count, self.available())
+
+    # Consumer: copy up to len(out) samples into out and consume them.
+    # Returns the number of samples copied.
+    def readInto(self, out):
+        out = out.reshape(-1, self.channels)
+        position = 0
+        for piece in self.peek(len(out)):
+            out[position:position + len(piece)] = piece
+            position += len(piece)
+
+        self.advance(position)
+        return position
+
+    # Consumer: read and consume up to count samples
+    def read(self, count):
+        out = numpy.empty((min(count, self.available()), self.channels), dtype=numpy.float32)
+        self.readInto(out)
+        return out
+
+
+class PyAudioBackend(object):
+    """
+    PortAudio backend. One PyAudio instance is kept for the life of the backend.
+    """
+
+    def __init__(self):
+        self._pyaudio = pyaudio.PyAudio()
+
+    # Open a callback-driven float32 stream.
+    # callback(input_samples or None, frame_count) returns the output samples or None.
+    def open(self, sample_rate, channels, frames_per_buffer, callback, input=True, output=True):
+        def portaudio_callback(in_data, frame_count, time_info, status):
+            samples = None
+            if in_data is not None:
+                # Zero-copy view of the captured bytes
+                samples = numpy.frombuffer(in_data, dtype=numpy.float32).reshape(-1, channels)
+
+            out = callback(samples, frame_count)
+            out_data = out.tobytes() if out is not None else None
+            return out_data, pyaudio.paContinue
+
+        return self._pyaudio.open(format=pyaudio.paFloat32, channels=channels, rate=int(sample_rate),
+                                  input=input, output=output, frames_per_buffer=frames_per_buffer,
+                                  stream_callback=portaudio_callback, start=False)
+
+    def terminate(self):
+        self._pyaudio.terminate()
+
+
+class StubStream(object):
+    def __init__(self, backend, channels, callback, input, output):
+        self.backend = backend
+        self.channels = channels
+        self.callback = callback
+        self.input = input
+        self.output = output
+        self.active = False
+
+    def start_stream(self):
+        self.active = True
+
+    def stop_stream(self):
+        self.active = False
+
+    def close(self):
+        self.active = False
+        self.backend.streams.remove(self)
+
+    def is_active(self):
+        return self.active
+
+
+class StubBackend(object):
+    """
+    Backend without a sound card, for tests. pump() runs the stream callbacks
+    synchronously: captured input comes from the signal passed to pump() (silence
+    by default) and played output is appended to played.
+    """
+
+    def __init__(self):
+        self.streams = []
+        self.played = []
+
+    def open(self, sample_rate, channels, frames_per_buffer, callback, input=True, output=True):
+        stream = StubStream(self, channels, callback, input, output)
+        self.streams.append(stream)
+        return stream
+
+    # Run one callback of frame_count samples on every active stream
+    def pump(self, frame_count, input_samples=None):
+        for stream in self.streams:
+            if not stream.active:
+                continue
+
+            samples = None
+            if stream.input:
+                if input_samples is None:
+                    samples = numpy.zeros((frame_count, stream.channels), dtype=numpy.float32)
+                else:
+                    samples = numpy.asarray(input_samples, dtype=numpy.float32).reshape(frame_count, stream.channels)
+
+            out = stream.callback(samples, frame_count)
+            if stream.output and out is not None:
+                self.played.append(numpy.array(out))
+
+    def terminate(self):
+        self.streams = []
+
+    # All played output so far as one array
+    def playedSamples(self):
+        if len(self.played) == 0:
+            return numpy.zeros((0, 1), dtype=numpy.float32)
+        return numpy.concatenate(self.played)
+
+
+class AudioSession(object):
+    """
+    A persistent full-duplex audio session with non-blocking playback and capture.
+    buffer_seconds sets the size of the playback and capture ring buffers.
+    """
+
+    def __init__(self, sample_rate=44100, channels=1, frames_per_buffer=1024, backend=None, buffer_seconds=10.0,
+                 input=True, output=True):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.backend = backend if backend is not None else PyAudioBackend()
+        self.metadata = Metadata.Metadata(sample_rate, channels, pyaudio.paFloat32)
+
+        capacity = int(buffer_seconds * sample_rate)
+        self.playback = RingBuffer(capacity, channels)
+        self.capture = RingBuffer(capacity, channels)
+        self.underruns = 0
+
+        self._output = numpy.zeros((frames_per_buffer, channels), dtype=numpy.float32)
+        self._write_lock = threading.Lock()
+        self._stream = self.backend.open(sample_rate, channels, frames_per_buffer, self._callback, input, output)
+
+    # Runs on the backend's audio thread
+    def _callback(self, input_samples, frame_count):
+        if input_samples is not None:
+            self.capture.write(input_samples)
+
+        if len(self._output) < frame_count:
+            self._output = numpy.zeros((frame_count, self.channels), dtype=numpy.float32)
+        out = self._output[:frame_count]
+
+        count = self.playback.readInto(out)
+        if count < frame_count:
+            out[count:] = 0
+            if count > 0:
+                self.underruns += 1
+
+        return out
+
+    def start(self):
+        self._stream.start_stream()
+
+    def stop(self):
+        self._stream.stop_stream()
+
+    # Stop the stream and release the backend
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+            self.backend.terminate()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Queue samples (e.g. a Frame) for playback without blocking.
+    # Returns the number of samples queued; the rest did not fit in the buffer.
+    def play(self, samples):
+        # play() may be called from several threads; the ring buffer has a single producer
+        with self._write_lock:
+            return self.playback.write(Metadata.plain(numpy.asarray(samples)))
+
+    # Number of queued samples not played yet
+    def pending(self):
+        return self.playback.available()
+
+    # Return all captured samples so far (up to max_samples) as a Frame, without blocking
+    def read(self, max_samples=None):
+        count = self.capture.available()
+        if max_samples is not None:
+            count = min(count, max_samples)
+        return self._toFrame(self.capture.read(count))
+
+    # Return exactly block_size captured samples as a Frame, or None if not available yet
+    def readBlock(self, block_size):
+        if self.capture.available() < block_size:
+            return None
+        return self._toFrame(self.capture.read(block_size))
+
+    def _toFrame(self, samples):
+        if self.channels == 1:
+            samples = samples.reshape(-1)
+        return Metadata.wrap(samples, pymir3x.Frame, self.metadata)
@@ -4,13 +4,14 @@ Load audio files (wav or mp3) into ndarray subclass
 Ported from https://github.com/jsawruk/pymir: 30 August 2017
 """
 
+import math
 import os
 import numpy
 import pyaudio
 import scipy.io.wavfile
 
-from pymir3x import Frame
-from subprocess import Popen, PIPE
+from pymir3x import Frame, Metadata
+from subprocess import CalledProcessError, DEVNULL, PIPE, Popen, check_output
 
 
 class AudioFile(Frame):
@@ -24,9 +25,7 @@ class AudioFile(Frame):
         obj = numpy.ndarray.__new__(cls, shape, dtype, buffer, offset, strides,
                                     order)
 
-        obj.sampleRate = 0
-        obj.channels = 1
-        obj.format = pyaudio.paFloat32
+        obj.metadata = Metadata.Metadata(0, 1, pyaudio.paFloat32)
 
         # Finally, we must return the newly created object:
         return obj
@@ -57,43 +56,39 @@ class AudioFile(Frame):
         # InfoArray.__new__ constructor, but also with
         # arr.view(InfoArray).
 
-        self.sampleRate = getattr(obj, 'sampleRate', None)
-        self.channels = getattr(obj, 'channels', None)
-        self.format = getattr(obj, 'format', None)
+        # The metadata object is shared, not copied: a single lookup per new array.
+        self.metadata = getattr(obj, 'metadata', Metadata.EMPTY)
 
         # We do not need to return anything
 
     # Open a file (WAV or MP3), return instance of this class with data loaded.
     # Note that this is a static method. This is the preferred method
     # of constructing this object.
+    # offset and duration (in seconds) select an excerpt: only that part of the file
+    # is read (WAV) or decoded (MP3/M4A, ffmpeg seeks before decoding).
     @staticmethod
-    def open(filename, sample_rate=44100):
+    def open(filename, sample_rate=44100, offset=0.0, duration=None):
         _, ext = os.path.splitext(filename)
 
         if ext.endswith('mp3') or ext.endswith('m4a'):
+            # Mixed down to mono by ffmpeg, as float32 (see decode)
+            return AudioFile.decode(filename, sample_rate, offset, duration, channels=1)
 
-            ffmpeg = Popen([
-                "ffmpeg",
-                "-i", filename,
-                "-vn", "-acodec", "pcm_s16le",  # Little Endian 16 bit PCM
-                "-ac", "1", "-ar", str(sample_rate),  # -ac = audio channels (1)
-                "-f", "s16le", "-"],  # -f wav for WAV file
-                stdin=PIPE, stdout=PIPE, stderr=open(os.devnull, "w"))
-
-            raw_data = ffmpeg.stdout
+        elif ext.endswith('wav'):
+            excerpt = offset > 0 or duration is not None
+            if excerpt:
+                # Memory-map the file: the sample offset into the data chunk is computed
+                # from the header and only the pages of the excerpt are read.
+                sample_rate, samples = scipy.io.wavfile.read(filename, mmap=True)
 
-            mp3_array = numpy.fromstring(raw_data.read(), numpy.int16)
-            mp3_array = mp3_array.astype('float32') / 32767.0
-            audio_file = mp3_array.view(AudioFile)
+                start = min(int(round(offset * sample_rate)), len(samples))
+                end = len(samples)
+                if duration is not None:
+                    end = min(start + int(round(duration * sample_rate)), end)
 
-            audio_file.sampleRate = sample_rate
-            audio_file.channels = 1
-            audio_file.format = pyaudio.paFloat32
-
-            return audio_file
-
-        elif ext.endswith('wav'):
-            sample_rate, samples = scipy.io.wavfile.read(filename)
+                samples = numpy.array(samples[start:end])
+            else:
+                sample_rate, samples = scipy.io.wavfile.read(filename)
 
             # Get the shape of the array so we know if it's in stereo.
             sample_shape = samples.shape
@@ -106,9 +101,102 @@ class AudioFile(Frame):
             if len(sample_shape) > 1:
                 samples = samples[:, 0].astype('float32') / 32767.0
 
-            audio_file = samples.view(AudioFile)
-            audio_file.sampleRate = sample_rate
-            audio_file.channels = 1
-            audio_file.format = pyaudio.paFloat32
+            audio_file = Metadata.wrap(samples, AudioFile, Metadata.Metadata(sample_rate, 1, pyaudio.paFloat32))
 
             return audio_file
+
+    # Decode a file with ffmpeg straight to float32, without an int16 round trip.
+    # channels=None keeps the file's native channel count (probed with ffprobe).
+    # The samples are read from the pipe directly into their final numpy buffer
+    # (see readPcmFloat32). Returns an AudioFile of shape (num_samples,) for mono,
+    # otherwise (num_samples, channels).
+    @staticmethod
+    def decode(filename, sample_rate=44100, offset=0.0, duration=None, channels=None):
+        if channels is None:
+            channels = AudioFile.probeChannels(filename)
+
+        ffmpeg = Popen(AudioFile.ffmpegCommand(filename, sample_rate, offset, duration, 'f32le', channels),
+                       stdin=DEVNULL, stdout=PIPE, stderr=DEVNULL)
+
+        # With a duration the length is known up front (ffmpeg may deliver a little less)
+        num_samples = None
+        if duration is not None:
+            num_samples = int(math.ceil(duration * sample_rate))
+
+        try:
+            samples = AudioFile.readPcmFloat32(ffmpeg.stdout, channels, num_samples)
+        finally:
+            ffmpeg.stdout.close()
+            ffmpeg.wait()
+
+        if channels == 1:
+            samples = samples.reshape(-1)
+
+        return Metadata.wrap(samples, AudioFile, Metadata.Metadata(sample_rate, channels, pyaudio.paFloat32))
+
+    # Return the channel count of the first audio stream of a file, using ffprobe.
+    # Falls back to 1 if it cannot be determined.
+    @staticmethod
+    def probeChannels(filename):
+        try:
+            output = check_output(["ffprobe", "-v", "error", "-select_streams", "a:0",
+                                   "-show_entries", "stream=channels",
+                                   "-of", "default=noprint_wrappers=1:nokey=1", filename], stderr=DEVNULL)
+            return int(output.split()[0])
+        except (OSError, CalledProcessError, ValueError, IndexError):
+            return 1
+
+    # Read little-endian float32 PCM from a binary stream (e.g. a pipe) with readinto,
+    # straight into the buffer that becomes the result: preallocated for num_samples
+    # when the length is known, otherwise grown in place as data arrives. A partial
+    # sample at the end is dropped. Returns a (num_samples, channels) float32 array.
+    @staticmethod
+    def readPcmFloat32(stream, channels=1, num_samples=None, block_samples=2 ** 18):
+        sample_bytes = 4 * channels
+        capacity = num_samples if num_samples else block_samples
+        buffer = numpy.empty(max(1, capacity) * channels, dtype='<f4')
+        filled = 0
+
+        while True:
+            if filled == buffer.nbytes:
+                # Full: grow in place and keep reading into the new tail. When the expected
+                # length was given it is usually exact, so grow by one block rather than double;
+                # the unused tail is trimmed at the end.
+                growth = block_samples * channels if num_samples else len(buffer)
+                buffer.resize(len(buffer) + growth, refcheck=False)
+
+            # The memoryview is released before the buffer may be resized
+            with memoryview(buffer.view(numpy.uint8)) as view:
+                count = stream.readinto(view[filled:])
+            if not count:
+                break
+            filled += count
+
+        num_samples = filled // sample_bytes
+        buffer.resize(num_samples * channels, refcheck=False)
+        return buffer.reshape(num_samples, channels)
+
+    # Build the ffmpeg command line that decodes filename to PCM on stdout:
+    # sample_format 's16le' (16 bit) or 'f32le' (32 bit float), little endian.
+    # channels=None keeps the native channel count.
+    # offset and duration (in seconds) select an excerpt; ffmpeg seeks before decoding.
+    @staticmethod
+    def ffmpegCommand(filename, sample_rate=44100, offset=0.0, duration=None, sample_format='s16le', channels=1):
+        seek_options = []
+        if offset > 0:
+            seek_options = ["-ss", str(offset)]  # Input seeking: skip before decoding
+
+        duration_options = []
+        if duration is not None:
+            duration_options = ["-t", str(duration)]
+
+        channel_options = []
+        if channels is not None:
+            channel_options = ["-ac", str(channels)]  # -ac = audio channels
+
+        return ([
+            "ffmpeg"] + seek_options + [
+            "-i", filename] + duration_options + [
+            "-vn", "-acodec", "pcm_" + sample_format] + channel_options + [
+            "-ar", str(sample_rate),
+            "-f", sample_format, "-"])  # -f wav for WAV file
@@ -0,0 +1,77 @@
+"""
+Budget.py
+Memory-budgeted (out-of-core) processing mode
+Inside a MemoryBudget block, analyses that support it (Energy, Transforms.stft,
+Tempo.onsetStrength and flux onsets, Pitch.yin, Segments and Separation) size
+their chunks so that their intermediate arrays stay within the budget, instead
+of materializing whole-signal intermediates. Chunks overlap where a result
+depends on neighbouring samples or frames, so results match whole-file
+processing up to floating-point rounding.
+The budget covers intermediates; the returned results are not counted.
+
+Usage:
+    with Budget.MemoryBudget(64 * 2 ** 20):
+        e = Energy.energy(audio_file)
+
+The budget is set per thread.
+"""
+
+import threading
+
+_state = threading.local()
+
+
+def getMemoryBudget():
+    """
+    Return the current memory budget in bytes, or None when unlimited.
+    """
+    return getattr(_state, 'budget', None)
+
+
+def setMemoryBudget(budget):
+    """
+    Set the memory budget in bytes for the current thread; None removes it.
+    """
+    if budget is not None and budget <= 0:
+        raise ValueError("The memory budget must be positive")
+    _state.budget = budget
+
+
+class MemoryBudget(object):
+    """
+    Context manager that sets a memory budget and restores the previous one on exit.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getMemoryBudget()
+        setMemoryBudget(self.budget)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        setMemoryBudget(self._previous)
+
+
+def chunkLength(bytes_per_item, default, overhead=0, minimum=1):
+    """
+    Return how many items (samples, frames) to process per chunk: default when
+    no budget is set, otherwise as many as fit in the budget after a fixed
+    overhead in bytes, but at least minimum.
+    """
+    budget = getMemoryBudget()
+    if budget is None:
+        return default
+
+    return max(minimum, int((budget - overhead) // bytes_per_item))
+
+
+def stftChunkFrames(frame_size, default):
+    """
+    Return how many STFT frames to process per chunk. Each frame holds a windowed
+    float64 copy of its samples, its complex spectrum and a magnitude spectrum.
+    """
+    num_bins = frame_size // 2 + 1
+    return chunkLength(8 * frame_size + 24 * num_bins, default)
@@ -7,46 +7,56 @@ Ported from https://github.com/jsawruk/pymir: 29 August 2017
 import numpy
 from numpy.lib import stride_tricks
 
+from pymir3x import Budget
 
-def energy(audio_data, window_size = 256):
+
+def _windowedPower(values, window_size):
     """
-    Compute the energy of the given audio data, using the given windowSize
+    Hamming-weighted mean of the squared values over each of the
+    len(values) - window_size windows. Under a memory budget the windows are
+    processed in chunks that overlap by window_size - 1 values, so the result is
+    the same as in one pass.
     """
-    audio_length = len(audio_data)
+    values = numpy.asarray(values)  # plain ndarray: no subclass overhead in the kernel
 
     window = numpy.hamming(window_size)
     window.shape = (window_size, 1)
 
-    n = audio_length - window_size  # number of windowed samples.
-
-    # Create a view of audioData who's shape is (n, windowSize). Use stride_tricks such that each stide jumps only one item.
-    p = numpy.power(audio_data, 2)
-    s = stride_tricks.as_strided(p, shape=(n, window_size), strides=(audio_data.itemsize, audio_data.itemsize))
-    e = numpy.dot(s, window) / window_size
-    e.shape = (e.shape[0],)
+    n = len(values) - window_size  # number of windowed samples.
+
+    # Each output costs one squared input value and one float64 result
+    chunk = Budget.chunkLength(values.itemsize + 8, n, overhead=window_size * (values.itemsize + 8))
+    if chunk >= n:
+        # Create a view of values whose shape is (n, windowSize). Use stride_tricks such that each stride jumps only one item.
+        p = numpy.power(values, 2)
+        s = stride_tricks.as_strided(p, shape=(n, window_size), strides=(values.itemsize, values.itemsize))
+        e = numpy.dot(s, window) / window_size
+        e.shape = (e.shape[0],)
+        return e
+
+    e = numpy.empty(n)
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        p = numpy.power(values[start:end + window_size - 1], 2)
+        s = stride_tricks.as_strided(p, shape=(end - start, window_size), strides=(p.itemsize, p.itemsize))
+        e[start:end] = numpy.dot(s, window)[:, 0] / window_size
     return e
 
 
+def energy(audio_data, window_size = 256):
+    """
+    Compute the energy of the given audio data, using the given windowSize
+    """
+    return _windowedPower(audio_data, window_size)
+
+
 def dEnergy(audio_data, window_size=256):
     """
     Compute the dEnergy differential term with windowing
     """
     e = energy(audio_data, window_size)
     diffE = numpy.diff(e)
-
-    diffLength = len(diffE)
-
-    window = numpy.hamming(window_size)
-    window.shape = (window_size, 1)
-
-    n = diffLength - window_size  # number of windowed samples.
-
-    # Create a view of diffE who's shape is (n, windowSize). Use stride_tricks such that each stide jumps only one item.
-    p = numpy.power(diffE, 2)
-    s = stride_tricks.as_strided(p, shape=(n, window_size), strides=(diffE.itemsize, diffE.itemsize))
-    dE = numpy.dot(s, window) / window_size
-    dE.shape = (dE.shape[0],)
-    return dE
+    return _windowedPower(diffE, window_size)
 
 
 def dLogEnergy(audio_data, window_size=256):
@@ -56,20 +66,7 @@ def dLogEnergy(audio_data, window_size=256):
     e = energy(audio_data, window_size)
     logE = numpy.log(e)
     diffLogE = numpy.diff(logE)
-
-    diffLogLength = len(diffLogE)
-
-    window = numpy.hamming(window_size)
-    window.shape = (window_size, 1)
-
-    n = diffLogLength - window_size  # number of windowed samples.
-
-    # Create a view of diffLogE who's shape is (n, windowSize). Use stride_tricks such that each stide jumps only one item.
-    p = numpy.power(diffLogE, 2)
-    s = stride_tricks.as_strided(p, shape=(n, window_size), strides=(diffLogE.itemsize, diffLogE.itemsize))
-    dLogE = numpy.dot(s, window) / window_size
-    dLogE.shape = (dLogE.shape[0],)
-    return dLogE
+    return _windowedPower(diffLogE, window_size)
 
 
 def _test():
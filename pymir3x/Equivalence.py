@@ -0,0 +1,234 @@
+"""
+Equivalence.py
+Reference-vs-fast equivalence harness for the vectorized kernels
+Every fast path is run against its original loop implementation (Reference.py)
+on deterministic synthetic signals - sines, chirps, noise, silence and clipped
+audio - at lengths and sample rates drawn from a fixed seed. Each kernel states
+its tolerance on the error relative to the largest reference value; values that
+are NaN in the reference (e.g. the centroid of silence) must be NaN in the fast
+path too. DTW is checked on pairs of spectrogram sequences of the same signal
+at different hop sizes: both the total cost and the cost of the returned path
+must match a plain O(nm) dynamic program (referenceDtw), an oracle written for
+this harness. The report lists the largest error and the speedup of every kernel.
+
+Usage:
+    python -m pymir3x.Equivalence
+"""
+
+import collections
+import sys
+import time
+import numpy
+
+import pymir3x
+from pymir3x import Alignment, Metadata, MFCC, Pitch, Reference, SpectralFlux, Transforms
+
+SAMPLE_RATES = (8000, 22050, 44100, 48000)
+
+MFCC_COEFFICIENTS = (0, 1, 2, 5, 12)
+
+DTW_RADIUS = 8
+
+
+def referenceDtw(x, y, start=None, end=None):
+    """
+    Compute the total DTW cost of aligning x and y with cosine costs and
+    diagonal, vertical and horizontal steps, restricted to the column windows
+    [start[i], end[i]) of every row (the full matrix if omitted). A plain O(nm)
+    dynamic program over the full cost matrix, used as the oracle for Alignment.dtw.
+    """
+    cost = Alignment.cosineCost(x, y)
+    n, m = cost.shape
+    if start is None:
+        start = [0] * n
+        end = [m] * n
+
+    inf = float('inf')
+    accumulated = [[inf] * m for _ in range(n)]
+    for i in range(n):
+        for j in range(start[i], end[i]):
+            if i == 0 and j == 0:
+                accumulated[i][j] = cost[i, j]
+                continue
+
+            best = inf
+            if i > 0 and j > 0:
+                best = min(best, accumulated[i - 1][j - 1])
+            if i > 0:
+                best = min(best, accumulated[i - 1][j])
+            if j > 0:
+                best = min(best, accumulated[i][j - 1])
+            accumulated[i][j] = cost[i, j] + best
+
+    return accumulated[n - 1][m - 1]
+
+
+def _dtwCosts(sequences, start=None, end=None):
+    """
+    Run Alignment.dtw and return [total_cost, cost of the returned path]. The
+    path cost is NaN if the path is not a connected path from the first to the
+    last cell inside the windows.
+    """
+    x, y = sequences
+    rows, columns, total_cost = Alignment.dtw(x, y, start, end)
+
+    steps = numpy.stack((numpy.diff(rows), numpy.diff(columns)), axis=1)
+    valid = (rows[0] == 0 and columns[0] == 0 and rows[-1] == len(x) - 1 and columns[-1] == len(y) - 1 and
+             numpy.all((steps >= 0) & (steps <= 1)) and numpy.all(steps.sum(axis=1) > 0))
+    if start is not None:
+        valid = valid and numpy.all((columns >= start[rows]) & (columns < end[rows]))
+
+    path_cost = Alignment.cosineCost(x, y)[rows, columns].sum() if valid else numpy.nan
+    return [total_cost, path_cost]
+
+
+def _band(sequences):
+    return Alignment.bandWindows(len(sequences[0]), len(sequences[1]), DTW_RADIUS)
+
+# Kernel name, reference, fast path, input kind ('frame', 'spectrum', 'spectra' or 'sequences'),
+# range of signal lengths, relative tolerance
+Kernel = collections.namedtuple('Kernel', ['name', 'reference', 'fast', 'kind', 'lengths', 'tolerance'])
+
+KERNELS = [
+    Kernel('Spectrum.centroid', Reference.centroid, lambda spectrum: spectrum.centroid(),
+           'spectrum', (256, 8192), 1e-9),
+    Kernel('MFCC.mfcc', lambda spectrum: [Reference.mfcc(spectrum, m) for m in MFCC_COEFFICIENTS],
+           lambda spectrum: [MFCC.mfcc(spectrum, m) for m in MFCC_COEFFICIENTS],
+           'spectrum', (256, 1024), 1e-9),
+    Kernel('Pitch.chroma', Reference.chroma, Pitch.chroma, 'spectrum', (256, 8192), 1e-9),
+    Kernel('SpectralFlux.spectralFlux', lambda spectra: Reference.spectralFlux(spectra, rectify=True),
+           lambda spectra: SpectralFlux.spectralFlux(spectra, rectify=True), 'spectra', (2048, 16384), 0.0),
+    Kernel('Frame.zcr', Reference.zcr, lambda frame: frame.zcr(), 'frame', (256, 65536), 0.0),
+    Kernel('Transforms.cqt', Reference.cqt, Transforms.cqt, 'frame', (16, 256), 1e-9),
+    Kernel('Alignment.dtw', lambda sequences: [referenceDtw(*sequences)] * 2, _dtwCosts,
+           'sequences', (2048, 16384), 1e-9),
+    Kernel('Alignment.dtw (banded)', lambda sequences: [referenceDtw(*(sequences + _band(sequences)))] * 2,
+           lambda sequences: _dtwCosts(sequences, *_band(sequences)), 'sequences', (2048, 16384), 1e-9),
+]
+
+SIGNALS = ('sine', 'chirp', 'noise', 'silence', 'clipped')
+
+
+def signal(kind, length, sample_rate, random):
+    """
+    Return a deterministic synthetic test signal of the given kind as a Frame.
+    """
+    t = numpy.arange(length) / float(sample_rate)
+    duration = length / float(sample_rate)
+
+    if kind == 'sine':
+        frequency = random.uniform(50, 0.4 * sample_rate)
+        samples = 0.5 * numpy.sin(2 * numpy.pi * frequency * t) + 0.25 * numpy.sin(2 * numpy.pi * 1.5 * frequency * t)
+    elif kind == 'chirp':
+        # Linear sweep from 50 Hz to 0.45 of the sample rate
+        rate = (0.45 * sample_rate - 50) / duration
+        samples = numpy.sin(2 * numpy.pi * (50 * t + 0.5 * rate * t ** 2))
+    elif kind == 'noise':
+        samples = random.uniform(-1, 1, length)
+    elif kind == 'silence':
+        samples = numpy.zeros(length)
+    elif kind == 'clipped':
+        frequency = random.uniform(50, 2000)
+        samples = numpy.clip(4 * numpy.sin(2 * numpy.pi * frequency * t), -1, 1)
+    else:
+        raise ValueError("Unknown signal '%s'" % kind)
+
+    return Metadata.wrap(samples, pymir3x.Frame, Metadata.Metadata(sample_rate, 1))
+
+
+def _inputs(kernel, frame):
+    if kernel.kind == 'frame':
+        return frame
+    if kernel.kind == 'spectrum':
+        return frame.spectrum()
+    if kernel.kind == 'sequences':
+        # The same signal analysed at two hop sizes, as if played at two tempi
+        return (numpy.abs(Transforms.stft(frame, 256, 128)), numpy.abs(Transforms.stft(frame, 256, 96)))
+    return [f.spectrum() for f in frame.frames(1024)]
+
+
+def error(reference, fast):
+    """
+    Largest absolute difference relative to the largest reference magnitude.
+    NaNs must match; a NaN mismatch or a shape mismatch is an infinite error.
+    """
+    reference = numpy.atleast_1d(numpy.asarray(reference, dtype=numpy.float64))
+    fast = numpy.atleast_1d(numpy.asarray(fast, dtype=numpy.float64))
+    if reference.shape != fast.shape:
+        return numpy.inf
+
+    reference_nan = numpy.isnan(reference)
+    if numpy.any(reference_nan != numpy.isnan(fast)):
+        return numpy.inf
+
+    reference = reference[~reference_nan]
+    fast = fast[~reference_nan]
+    if len(reference) == 0:
+        return 0.0
+
+    scale = max(numpy.abs(reference).max(), numpy.finfo(float).tiny)
+    return numpy.abs(fast - reference).max() / scale
+
+
+def _timed(function, argument):
+    start = time.perf_counter()
+    result = function(argument)
+    return result, time.perf_counter() - start
+
+
+def check(kernels=None, cases=3, seed=0):
+    """
+    Run every kernel on cases randomly drawn lengths and sample rates per signal kind.
+    Returns a list of result dicts (kernel, signal, length, sample_rate, error,
+    tolerance, passed, reference_time, fast_time).
+    """
+    random = numpy.random.RandomState(seed)
+    results = []
+    for kernel in kernels or KERNELS:
+        for kind in SIGNALS:
+            for _ in range(cases):
+                length = int(random.randint(kernel.lengths[0], kernel.lengths[1] + 1))
+                sample_rate = int(random.choice(SAMPLE_RATES))
+                inputs = _inputs(kernel, signal(kind, length, sample_rate, random))
+
+                with numpy.errstate(all='ignore'):
+                    reference, reference_time = _timed(kernel.reference, inputs)
+                    fast, fast_time = _timed(kernel.fast, inputs)
+
+                kernel_error = error(reference, fast)
+                results.append({'kernel': kernel.name, 'signal': kind, 'length': length, 'sample_rate': sample_rate,
+                                'error': kernel_error, 'tolerance': kernel.tolerance,
+                                'passed': kernel_error <= kernel.tolerance,
+                                'reference_time': reference_time, 'fast_time': fast_time})
+
+    return results
+
+
+def report(results, out=sys.stdout):
+    """
+    Print one line per kernel with the largest error, the tolerance, the overall
+    speedup and any failing cases. Returns True if every case passed.
+    """
+    names = []
+    for result in results:
+        if result['kernel'] not in names:
+            names.append(result['kernel'])
+
+    out.write("%-28s %12s %10s %9s  %s\n" % ('kernel', 'max error', 'tolerance', 'speedup', 'status'))
+    for name in names:
+        kernel_results = [r for r in results if r['kernel'] == name]
+        max_error = max(r['error'] for r in kernel_results)
+        reference_time = sum(r['reference_time'] for r in kernel_results)
+        fast_time = sum(r['fast_time'] for r in kernel_results)
+        failures = [r for r in kernel_results if not r['passed']]
+
+        status = 'ok' if not failures else 'FAILED: ' + ', '.join(
+            '%s (n=%d, sr=%d)' % (r['signal'], r['length'], r['sample_rate']) for r in failures)
+        out.write("%-28s %12.3g %10.3g %8.1fx  %s\n" % (name, max_error, kernel_results[0]['tolerance'],
+                                                        reference_time / max(fast_time, 1e-9), status))
+
+    return all(r['passed'] for r in results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if report(check()) else 1)
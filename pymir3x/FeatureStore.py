@@ -0,0 +1,218 @@
+"""
+FeatureStore.py
+Compact on-disk container for spectrograms and aligned feature tracks
+Arrays are stored as a sequence of chunks of frames (rows), optionally
+quantized to float16, followed by a JSON footer holding the chunk table and
+the sampleRate/hop_size/frame_size metadata. Files are memory-mapped for
+reading, so reading a time range only touches the chunks that overlap it.
+
+File layout:
+    preamble   8-byte magic, uint32 version, uint32 reserved,
+               uint64 footer offset, uint64 footer length (little endian)
+    chunks     raw C-ordered frames of each array, 16-byte aligned
+    footer     UTF-8 JSON
+"""
+
+import json
+import math
+import struct
+import numpy
+
+MAGIC = b'PMIRFEAT'
+VERSION = 1
+PREAMBLE = struct.Struct('<8sIIQQ')
+ALIGNMENT = 16
+
+
+class FeatureWriter(object):
+    """
+    Write spectrograms and feature tracks block by block. Every array is a
+    sequence of frames at the same hop size; write() appends frames to an array
+    and full chunks are written to disk as soon as they are complete.
+    """
+
+    def __init__(self, filename, sample_rate, hop_size, frame_size=None, chunk_frames=1024, attributes=None):
+        self.filename = filename
+        self.chunk_frames = chunk_frames
+        self.header = {'sampleRate': sample_rate, 'hop_size': hop_size, 'frame_size': frame_size,
+                       'chunk_frames': chunk_frames, 'attributes': attributes or {}, 'arrays': {}}
+        self._buffers = {}
+        self._file = open(filename, 'wb')
+        self._file.write(PREAMBLE.pack(MAGIC, VERSION, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Append frames (one per row, or a 1-D feature track) to the named array.
+    # With quantize=True, real data is stored as float16; values beyond the float16
+    # range (about 65504) are rejected instead of being stored as infinities.
+    def write(self, name, block, quantize=False):
+        block = numpy.asarray(block)
+        if block.ndim == 0:
+            raise ValueError("Expected at least one frame")
+
+        info = self.header['arrays'].get(name)
+        if info is None:
+            if numpy.iscomplexobj(block):
+                if quantize:
+                    raise ValueError("Complex data cannot be quantized; store magnitudes instead")
+                dtype = numpy.dtype(numpy.complex64)
+            else:
+                dtype = numpy.dtype(numpy.float16 if quantize else numpy.float32)
+        else:
+            dtype = numpy.dtype(info['dtype'])
+            if list(block.shape[1:]) != info['shape']:
+                raise ValueError("Expected frames of shape %s for '%s', got %s" %
+                                 (info['shape'], name, block.shape[1:]))
+
+        if dtype == numpy.float16 and numpy.any(numpy.abs(block) > numpy.finfo(numpy.float16).max):
+            raise ValueError("Values of '%s' exceed the float16 range (%g); store log or normalized values "
+                             "to quantize them" % (name, numpy.finfo(numpy.float16).max))
+
+        if info is None:
+            info = {'dtype': dtype.str, 'shape': list(block.shape[1:]), 'frames': 0, 'chunks': []}
+            self.header['arrays'][name] = info
+            self._buffers[name] = []
+
+        self._buffers[name].append(block.astype(dtype))
+        buffered = sum(len(b) for b in self._buffers[name])
+        if buffered >= self.chunk_frames:
+            data = numpy.concatenate(self._buffers[name])
+            full = (len(data) // self.chunk_frames) * self.chunk_frames
+            for start in range(0, full, self.chunk_frames):
+                self._writeChunk(name, data[start:start + self.chunk_frames])
+            self._buffers[name] = [data[full:]]
+
+    def _writeChunk(self, name, data):
+        info = self.header['arrays'][name]
+        position = self._file.tell()
+        padding = -position % ALIGNMENT
+        self._file.write(b'\0' * padding)
+
+        info['chunks'].append([info['frames'], len(data), position + padding])
+        info['frames'] += len(data)
+        self._file.write(numpy.ascontiguousarray(data).tobytes())
+
+    # Flush the remaining frames, write the footer and close the file
+    def close(self):
+        if self._file is None:
+            return
+
+        for name, buffers in self._buffers.items():
+            data = numpy.concatenate(buffers) if len(buffers) > 0 else []
+            if len(data) > 0:
+                self._writeChunk(name, data)
+
+        footer = json.dumps(self.header).encode('utf-8')
+        footer_offset = self._file.tell()
+        self._file.write(footer)
+        self._file.seek(0)
+        self._file.write(PREAMBLE.pack(MAGIC, VERSION, 0, footer_offset, len(footer)))
+        self._file.close()
+        self._file = None
+
+
+class FeatureReader(object):
+    """
+    Memory-mapped, time-indexed reader for files written by FeatureWriter.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            magic, version, _, footer_offset, footer_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError("%s is not a pymir3x feature file" % filename)
+            if version > VERSION:
+                raise ValueError("Unsupported feature file version %d" % version)
+
+            f.seek(footer_offset)
+            self.header = json.loads(f.read(footer_length).decode('utf-8'))
+
+        self.sampleRate = self.header['sampleRate']
+        self.hop_size = self.header['hop_size']
+        self.frame_size = self.header['frame_size']
+        self.attributes = self.header['attributes']
+        self._map = numpy.memmap(filename, dtype=numpy.uint8, mode='r')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._map = None
+
+    # Names of the stored arrays
+    def names(self):
+        return list(self.header['arrays'].keys())
+
+    # Number of frames of the named array
+    def numFrames(self, name):
+        return self.header['arrays'][name]['frames']
+
+    # Convert a time in seconds to the index of the frame starting at or before it.
+    # With end=True, return the index of the first frame starting at or after it
+    # instead, i.e. an exclusive end index for the frames starting before it.
+    # Times are rounded to a millionth of a sample so that exact frame start times
+    # map to their own frame.
+    def timeToFrame(self, time, end=False):
+        samples = round(time * self.sampleRate, 6)
+        if end:
+            return int(math.ceil(samples / self.hop_size))
+        return int(samples // self.hop_size)
+
+    # Convert frame indices to their start times in seconds
+    def frameTimes(self, frames):
+        return numpy.asarray(frames) * self.hop_size / float(self.sampleRate)
+
+    # Read frames [start, end) of the named array. Only overlapping chunks are touched.
+    # Quantized data is returned as float32.
+    def readFrames(self, name, start=0, end=None):
+        info = self.header['arrays'][name]
+        dtype = numpy.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        frame_bytes = dtype.itemsize * int(numpy.prod(shape))
+        if end is None or end > info['frames']:
+            end = info['frames']
+        start = max(0, min(start, end))
+
+        output_dtype = numpy.float32 if dtype == numpy.float16 else dtype
+        result = numpy.empty((end - start,) + shape, dtype=output_dtype)
+        for chunk_start, chunk_frames, offset in info['chunks']:
+            lo = max(start, chunk_start)
+            hi = min(end, chunk_start + chunk_frames)
+            if lo >= hi:
+                continue
+
+            begin = offset + (lo - chunk_start) * frame_bytes
+            data = self._map[begin:begin + (hi - lo) * frame_bytes].view(dtype).reshape((hi - lo,) + shape)
+            result[lo - start:hi - start] = data
+
+        return result
+
+    # Read the frames of the named array from the one containing start_time up to the
+    # last one starting before end_time (in seconds)
+    def read(self, name, start_time=0.0, end_time=None):
+        end = None if end_time is None else self.timeToFrame(end_time, end=True)
+        return self.readFrames(name, self.timeToFrame(start_time), end)
+
+
+def save(filename, arrays, sample_rate, hop_size, frame_size=None, quantize=False, chunk_frames=1024):
+    """
+    Save a dict of name -> frame-aligned array (e.g. {'spectrogram': S, 'centroid': c}).
+    """
+    with FeatureWriter(filename, sample_rate, hop_size, frame_size, chunk_frames) as writer:
+        for name, array in arrays.items():
+            writer.write(name, array, quantize)
+
+
+def load(filename):
+    """
+    Open a feature file for time-indexed reading.
+    """
+    return FeatureReader(filename)
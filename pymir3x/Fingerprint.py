@@ -0,0 +1,247 @@
+"""
+Fingerprint.py
+Spectral-peak (constellation) audio fingerprinting
+- Peaks: local maxima of the log-magnitude spectrogram
+- Hashes: pairs of nearby peaks packed into 32-bit integers
+- FingerprintIndex: sorted, array-backed inverted index from hash to (track, offset)
+  that can be saved to disk, memory-mapped and merged
+
+Queries are matched by a vectorized histogram of time offsets between the query
+and every indexed track sharing its hashes.
+"""
+
+import os
+import numpy
+import scipy.ndimage
+
+from pymir3x import Transforms
+
+FREQUENCY_BITS = 10
+DELTA_BITS = 6
+
+
+def peaks(audio_data, frame_size=2048, hop_size=512, neighbourhood=(11, 21), floor_db=-60.0):
+    """
+    Find the constellation peaks of the spectrogram of the given audio data.
+    A peak is a time-frequency bin that is the maximum of its neighbourhood
+    (frames, bins) and lies within floor_db of the loudest bin.
+    Returns (frames, bins), sorted by frame and then by bin.
+    """
+    magnitudes = numpy.abs(Transforms.stft(audio_data, frame_size, hop_size))
+    log_magnitudes = 20 * numpy.log10(magnitudes + 1e-10)
+
+    local_max = scipy.ndimage.maximum_filter(log_magnitudes, size=neighbourhood, mode='constant', cval=-numpy.inf)
+    is_peak = (log_magnitudes == local_max) & (log_magnitudes > log_magnitudes.max() + floor_db)
+
+    # Ignore the DC bin
+    is_peak[:, 0] = False
+
+    peak_frames, peak_bins = numpy.nonzero(is_peak)
+    return peak_frames, peak_bins
+
+
+def frequencyShift(frame_size):
+    """
+    Return the number of least significant bits dropped from the bins of a
+    frame_size spectrum (frame_size // 2 + 1 bins) to fit them in FREQUENCY_BITS.
+    It depends only on the frame size, so that the same peak pair hashes the
+    same in every clip.
+    """
+    shift = 0
+    while ((frame_size // 2) >> shift) >= 2 ** FREQUENCY_BITS:
+        shift += 1
+    return shift
+
+
+def hashes(peak_frames, peak_bins, fan_out=10, max_delta=2 ** DELTA_BITS - 1, frame_size=2048):
+    """
+    Pair every peak with up to fan_out following peaks less than max_delta frames
+    later, and pack (anchor bin, target bin, frame delta) into a uint32 hash.
+    Bins of the frame_size spectrum are reduced to FREQUENCY_BITS bits by dropping
+    their least significant bits (see frequencyShift).
+    Returns (hashes, anchor_frames).
+    """
+    peak_frames = numpy.asarray(peak_frames, dtype=numpy.int64)
+    peak_bins = numpy.asarray(peak_bins, dtype=numpy.int64)
+    max_delta = min(max_delta, 2 ** DELTA_BITS - 1)
+    reduced_bins = peak_bins >> frequencyShift(frame_size)
+
+    all_hashes = []
+    all_frames = []
+    for k in range(1, fan_out + 1):
+        anchors = numpy.arange(len(peak_frames) - k)
+        targets = anchors + k
+        delta = peak_frames[targets] - peak_frames[anchors]
+        valid = (delta > 0) & (delta <= max_delta)
+        anchors = anchors[valid]
+        targets = targets[valid]
+
+        packed = ((reduced_bins[anchors] << (FREQUENCY_BITS + DELTA_BITS)) |
+                  (reduced_bins[targets] << DELTA_BITS) |
+                  delta[valid])
+        all_hashes.append(packed.astype(numpy.uint32))
+        all_frames.append(peak_frames[anchors].astype(numpy.uint32))
+
+    if len(all_hashes) == 0:
+        return numpy.array([], dtype=numpy.uint32), numpy.array([], dtype=numpy.uint32)
+
+    return numpy.concatenate(all_hashes), numpy.concatenate(all_frames)
+
+
+def fingerprint(audio_data, frame_size=2048, hop_size=512, fan_out=10):
+    """
+    Compute the fingerprint hashes of the given audio data.
+    Returns (hashes, anchor_frames).
+    """
+    peak_frames, peak_bins = peaks(audio_data, frame_size, hop_size)
+    return hashes(peak_frames, peak_bins, fan_out, frame_size=frame_size)
+
+
+def _mergeSorted(keys_a, values_a, keys_b, values_b):
+    """
+    Merge two hash-sorted posting lists. values_* are tuples of arrays aligned with keys_*.
+    Entries of b are placed after entries of a with equal keys.
+    """
+    positions = numpy.searchsorted(keys_a, keys_b, side='right') + numpy.arange(len(keys_b))
+    from_a = numpy.ones(len(keys_a) + len(keys_b), dtype=bool)
+    from_a[positions] = False
+
+    keys = numpy.empty(len(from_a), dtype=keys_a.dtype)
+    keys[from_a] = keys_a
+    keys[positions] = keys_b
+
+    values = []
+    for a, b in zip(values_a, values_b):
+        merged = numpy.empty(len(from_a), dtype=a.dtype)
+        merged[from_a] = a
+        merged[positions] = b
+        values.append(merged)
+
+    return keys, tuple(values)
+
+
+class FingerprintIndex(object):
+    """
+    Inverted index from fingerprint hash to (track id, anchor frame).
+    Postings are stored in three parallel uint32 arrays sorted by hash. Added
+    fingerprints are buffered and merged into the sorted arrays on the next
+    query, commit or save.
+    """
+
+    def __init__(self):
+        self.hashes = numpy.array([], dtype=numpy.uint32)
+        self.tracks = numpy.array([], dtype=numpy.uint32)
+        self.offsets = numpy.array([], dtype=numpy.uint32)
+        self._pending = []
+
+    def __len__(self):
+        return len(self.hashes) + sum(len(p[0]) for p in self._pending)
+
+    # Add the fingerprint hashes of one track
+    def add(self, track_id, track_hashes, anchor_frames):
+        track_hashes = numpy.asarray(track_hashes, dtype=numpy.uint32)
+        anchor_frames = numpy.asarray(anchor_frames, dtype=numpy.uint32)
+        track_ids = numpy.empty(len(track_hashes), dtype=numpy.uint32)
+        track_ids.fill(track_id)
+        self._pending.append((track_hashes, track_ids, anchor_frames))
+
+    # Fingerprint the audio of one track and add it
+    def addAudio(self, track_id, audio_data, frame_size=2048, hop_size=512, fan_out=10):
+        track_hashes, anchor_frames = fingerprint(audio_data, frame_size, hop_size, fan_out)
+        self.add(track_id, track_hashes, anchor_frames)
+
+    # Merge buffered additions into the sorted posting arrays
+    def commit(self):
+        if len(self._pending) == 0:
+            return
+
+        new_hashes, new_tracks, new_offsets = [numpy.concatenate(p) for p in zip(*self._pending)]
+        self._pending = []
+
+        order = numpy.argsort(new_hashes, kind='mergesort')
+        self.hashes, (self.tracks, self.offsets) = _mergeSorted(
+            self.hashes, (self.tracks, self.offsets),
+            new_hashes[order], (new_tracks[order], new_offsets[order]))
+
+    # Merge another index into this one
+    def merge(self, other):
+        self.commit()
+        other.commit()
+        self.hashes, (self.tracks, self.offsets) = _mergeSorted(
+            self.hashes, (self.tracks, self.offsets),
+            other.hashes, (other.tracks, other.offsets))
+
+    # Match query hashes against the index.
+    # Returns up to top (track_id, score, offset) tuples, best first, where score is the
+    # number of hashes agreeing on the same time offset (in frames) into the track.
+    def query(self, query_hashes, query_frames, top=5, max_postings=None):
+        self.commit()
+        query_hashes = numpy.asarray(query_hashes, dtype=numpy.uint32)
+        query_frames = numpy.asarray(query_frames, dtype=numpy.int64)
+
+        lo = numpy.searchsorted(self.hashes, query_hashes, side='left')
+        hi = numpy.searchsorted(self.hashes, query_hashes, side='right')
+        counts = hi - lo
+
+        # Very common hashes carry little information; optionally skip them
+        if max_postings is not None:
+            counts[counts > max_postings] = 0
+
+        total = int(counts.sum())
+        if total == 0:
+            return []
+
+        # Expand every [lo, hi) posting range without a Python loop
+        query_index = numpy.repeat(numpy.arange(len(query_hashes)), counts)
+        range_starts = numpy.cumsum(counts) - counts
+        positions = numpy.repeat(lo, counts) + numpy.arange(total) - numpy.repeat(range_starts, counts)
+
+        tracks = self.tracks[positions].astype(numpy.int64)
+        deltas = self.offsets[positions].astype(numpy.int64) - query_frames[query_index]
+
+        # Histogram of (track, offset) pairs
+        delta_min = deltas.min()
+        span = int(deltas.max() - delta_min) + 1
+        keys, votes = numpy.unique(tracks * span + (deltas - delta_min), return_counts=True)
+        key_tracks = keys // span
+
+        # Best offset of each track (keys are sorted by track)
+        track_starts = numpy.flatnonzero(numpy.r_[True, key_tracks[1:] != key_tracks[:-1]])
+        best_votes = numpy.maximum.reduceat(votes, track_starts)
+        track_ends = numpy.r_[track_starts[1:], len(keys)]
+        is_best = votes == numpy.repeat(best_votes, track_ends - track_starts)
+        best_keys = numpy.maximum.reduceat(numpy.where(is_best, numpy.arange(len(keys)), -1), track_starts)
+
+        ranking = numpy.argsort(-best_votes, kind='mergesort')[:top]
+        results = []
+        for r in ranking:
+            key = keys[best_keys[r]]
+            results.append((int(key // span), int(best_votes[r]), int(key % span + delta_min)))
+
+        return results
+
+    # Fingerprint audio and match it against the index
+    def queryAudio(self, audio_data, top=5, frame_size=2048, hop_size=512, fan_out=10):
+        query_hashes, query_frames = fingerprint(audio_data, frame_size, hop_size, fan_out)
+        return self.query(query_hashes, query_frames, top)
+
+    # Save the index as a directory of .npy arrays
+    def save(self, path):
+        self.commit()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        numpy.save(os.path.join(path, 'hashes.npy'), self.hashes)
+        numpy.save(os.path.join(path, 'tracks.npy'), self.tracks)
+        numpy.save(os.path.join(path, 'offsets.npy'), self.offsets)
+
+    # Load an index saved with save(). With mmap=True the arrays are memory-mapped
+    # read-only, so a large index is paged in on demand by queries.
+    @staticmethod
+    def load(path, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        index = FingerprintIndex()
+        index.hashes = numpy.load(os.path.join(path, 'hashes.npy'), mmap_mode=mmap_mode)
+        index.tracks = numpy.load(os.path.join(path, 'tracks.npy'), mmap_mode=mmap_mode)
+        index.offsets = numpy.load(os.path.join(path, 'offsets.npy'), mmap_mode=mmap_mode)
+        return index
@@ -9,8 +9,9 @@ import numpy
 import pyaudio
 
 from math import sqrt
-from numpy.lib import stride_tricks
-from pymir3x import Transforms, AudioFile
+from pymir3x import Energy, Metadata, Overview, Transforms, Segments
+
+PLOT_SAMPLES = 2 ** 16
 
 
 class Frame(numpy.ndarray):
@@ -23,9 +24,7 @@ class Frame(numpy.ndarray):
         obj = numpy.ndarray.__new__(cls, shape, dtype, buffer, offset, strides,
                                     order)
 
-        obj.sampleRate = 0
-        obj.channels = 1
-        obj.format = pyaudio.paFloat32
+        obj.metadata = Metadata.Metadata(0, 1, pyaudio.paFloat32)
 
         # Finally, we must return the newly created object:
         return obj
@@ -56,12 +55,23 @@ class Frame(numpy.ndarray):
         # InfoArray.__new__ constructor, but also with
         # arr.view(InfoArray).
 
-        self.sampleRate = getattr(obj, 'sampleRate', None)
-        self.channels = getattr(obj, 'channels', None)
-        self.format = getattr(obj, 'format', None)
+        # The metadata object is shared, not copied: a single lookup per new array.
+        self.metadata = getattr(obj, 'metadata', Metadata.EMPTY)
 
         # We do not need to return anything
 
+    # Signal metadata, stored in one shared Metadata object (see Metadata.py)
+    sampleRate = Metadata.attribute('sampleRate')
+    channels = Metadata.attribute('channels')
+    format = Metadata.attribute('format')
+
+    # Keep the metadata when pickling (e.g. when sent to another process)
+    def __reduce__(self):
+        return Metadata.reduce(self)
+
+    def __setstate__(self, state):
+        Metadata.setstate(self, state)
+
     #####################
     # Frame methods
     #####################
@@ -76,62 +86,29 @@ class Frame(numpy.ndarray):
 
     # Compute the energy of this frame
     def energy(self, window_size=256):
-        frame_length = len(self)
-
-        window = numpy.hamming(window_size)
-        window.shape = (window_size, 1)
-
-        n = frame_length - window_size  # number of windowed samples.
-
-        # Create a view of signal who's shape is (n, windowSize).
-        # Use stride_tricks such that each stride jumps only one item.
-        p = numpy.power(self, 2)
-        s = stride_tricks.as_strided(p, shape=(n, window_size),
-                                     strides=(self.itemsize, self.itemsize))
-        e = numpy.dot(s, window) / window_size
-        e.shape = (e.shape[0],)
-        return e
+        return Energy.energy(Metadata.plain(self), window_size)
 
     # Decompose this frame into smaller frames of size frameSize
     def frames(self, frame_size, window_function=None):
-        frames = []
-        start = 0
-        end = frame_size
-        while start < len(self):
-
-            if window_function is None:
-                frames.append(self[start:end])
-            else:
-                window = window_function(frame_size)
-                window.shape = (frame_size, 1)
-                window = numpy.squeeze(window)
-                frame = self[start:end]
-                if len(frame) < len(window):
-                    # Zero pad
-                    frame_type = frame.__class__.__name__
+        frame_class = type(self)
+        metadata = self.metadata
+        samples = Metadata.plain(self)
 
-                    sample_rate = frame.sampleRate
-                    channels = frame.channels
-                    frame_format = frame.format
+        window = None
+        if window_function is not None:
+            window = numpy.squeeze(window_function(frame_size))
 
-                    diff = len(window) - len(frame)
-                    frame = numpy.append(frame, [0] * diff)
-
-                    if frame_type == "AudioFile":
-                        frame = frame.view(AudioFile)
-                    else:
-                        frame = frame.view(Frame)
-
-                    # Restore frame properties
-                    frame.sampleRate = sample_rate
-                    frame.channels = channels
-                    frame.format = frame_format
+        frames = []
+        for start in range(0, len(samples), frame_size):
+            frame = samples[start:start + frame_size]
 
-                windowed_frame = frame * window
-                frames.append(windowed_frame)
+            if window is not None:
+                if len(frame) < frame_size:
+                    # Zero pad
+                    frame = numpy.append(frame, numpy.zeros(frame_size - len(frame)))
+                frame = frame * window
 
-            start = start + frame_size
-            end = end + frame_size
+            frames.append(Metadata.wrap(frame, frame_class, metadata))
 
         return frames
 
@@ -143,16 +120,28 @@ class Frame(numpy.ndarray):
 
         return frames
 
+    # Build a table of the segments between consecutive onsets. Unlike framesFromOnsets
+    # this creates no per-segment objects; see Segments.SegmentTable
+    def segmentsFromOnsets(self, onsets):
+        return Segments.SegmentTable.fromOnsets(self, onsets)
+
     # Play this frame through the default playback device using pyaudio (PortAudio)
-    # Note: This is a blocking operation.
-    def play(self):
+    # Note: This is a blocking operation, unless an AudioDevice.AudioSession is given,
+    # in which case the frame is queued on the session's open stream and play returns at once.
+    def play(self, session=None):
+        if session is not None:
+            return session.play(self)
+
         # Create the stream
         p = pyaudio.PyAudio()
         stream = p.open(format=self.format, channels=self.channels, rate=self.sampleRate,
                         output=True)
 
-        # Write the audio data to the stream
-        audio_data = self.tostring()
+        # Write the audio data to the stream; float formats are played as float32
+        samples = Metadata.plain(self)
+        if self.format == pyaudio.paFloat32:
+            samples = samples.astype(numpy.float32)
+        audio_data = samples.tobytes()
         stream.write(audio_data)
 
         # Close the stream
@@ -160,8 +149,18 @@ class Frame(numpy.ndarray):
         stream.close()
         p.terminate()
 
+    # Build the min/max/RMS overview pyramid of this frame (see Overview.py)
+    def overview(self, base_block=64):
+        return Overview.build(self, base_block)
+
     # Plot the frame using matplotlib
+    # Frames longer than PLOT_SAMPLES are drawn from their overview, so matplotlib
+    # receives a few thousand values instead of every sample.
     def plot(self):
+        if len(self) > PLOT_SAMPLES:
+            Overview.build(self, sample_rate=1).plot()  # x axis in samples, as below
+            return
+
         plt.plot(self)
         plt.xlim(0, len(self))
         plt.ylim(-1.5, 1.5)
@@ -182,10 +181,9 @@ class Frame(numpy.ndarray):
         return Transforms.fft(self)
 
     # Compute the Zero-crossing rate (ZCR)
+    # Vectorized; Reference.zcr is the original loop (see Equivalence.py)
     def zcr(self):
-        zcr = 0
-        for i in range(1, len(self)):
-            if (self[i - 1] * self[i]) < 0:
-                zcr = zcr + 1
+        samples = Metadata.plain(self)
+        zcr = numpy.count_nonzero(samples[:-1] * samples[1:] < 0)
 
         return zcr / (1.0 * len(self))
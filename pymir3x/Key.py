@@ -0,0 +1,146 @@
+"""
+Key.py
+Musical key estimation by correlating accumulated chroma with the
+Krumhansl-Kessler key profiles
+The 24 rotated major and minor profiles are stored as one (24, 12) matrix of
+centred, unit-norm rows, so the Pearson correlation of a chroma vector with
+every key, or of a whole corpus of chroma vectors with every key, is a single
+matrix product. Rows follow the order of Pitch.chords (C, Cm, C#, C#m, ...).
+"""
+
+import numpy
+
+from pymir3x import Budget, Pitch, Transforms
+
+# Krumhansl-Kessler probe-tone profiles, tonic first
+MAJOR_PROFILE = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+MINOR_PROFILE = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+KEY_NAMES = [chord['name'] for chord in Pitch.chords]
+
+_profile_matrix = None
+
+
+def _centre(vectors):
+    """
+    Centre and L2-normalize the last axis, so that dot products are Pearson correlations.
+    Constant vectors (e.g. silence) become zeros.
+    """
+    vectors = numpy.array(vectors, dtype=numpy.float64)
+    vectors -= vectors.mean(axis=-1)[..., None]
+    norms = numpy.sqrt((vectors ** 2).sum(axis=-1))
+    norms = numpy.where(norms == 0, 1, norms)
+    return vectors / norms[..., None]
+
+
+def profileMatrix():
+    """
+    Return the (24, 12) matrix of centred, unit-norm key profiles, one row per
+    key in the order of Pitch.chords. The matrix is built once.
+    """
+    global _profile_matrix
+    if _profile_matrix is None:
+        profiles = numpy.zeros((24, 12))
+        for i, chord in enumerate(Pitch.chords):
+            profile = MAJOR_PROFILE if chord['mode'] == 1 else MINOR_PROFILE
+            profiles[i] = numpy.roll(profile, chord['key'])
+        _profile_matrix = _centre(profiles)
+
+    return _profile_matrix
+
+
+def scores(chroma):
+    """
+    Correlate chroma vectors (..., 12) with all 24 key profiles.
+    Returns (..., 24) correlation coefficients.
+    """
+    return numpy.dot(_centre(chroma), profileMatrix().T)
+
+
+def estimate(chroma):
+    """
+    Return the best matching key of a chroma vector as (name, correlation).
+    """
+    key_scores = scores(chroma)
+    best = int(numpy.argmax(key_scores))
+    return KEY_NAMES[best], key_scores[best]
+
+
+def estimateCorpus(chroma_profiles):
+    """
+    Estimate the keys of a corpus at once from its (num_tracks, 12) accumulated
+    chroma profiles. Returns (names, correlations).
+    """
+    key_scores = scores(numpy.atleast_2d(chroma_profiles))
+    best = numpy.argmax(key_scores, axis=1)
+    return [KEY_NAMES[i] for i in best], key_scores[numpy.arange(len(best)), best]
+
+
+class KeyEstimator(object):
+    """
+    Incremental key estimator. Blocks of chroma (or of spectra) are added as
+    they arrive; key() can be asked at any time and reflects everything seen so far.
+    """
+
+    def __init__(self):
+        self.profile = numpy.zeros(12)
+        self.weight = 0.0
+
+    # Add a block of chroma vectors (num_frames, 12), optionally weighted per frame
+    # (e.g. by frame energy, so that quiet frames count less)
+    def update(self, chroma_block, weights=None):
+        chroma_block = numpy.atleast_2d(chroma_block)
+        if weights is None:
+            self.profile += chroma_block.sum(axis=0)
+            self.weight += len(chroma_block)
+        else:
+            weights = numpy.asarray(weights, dtype=numpy.float64)
+            self.profile += numpy.dot(weights, chroma_block)
+            self.weight += weights.sum()
+        return self
+
+    # Add a block of spectra (num_frames, num_bins) through Pitch.chromaMatrix
+    def updateSpectra(self, spectra, sample_rate, weights=None):
+        return self.update(Pitch.chromaMatrix(spectra, sample_rate), weights)
+
+    # Combine with the estimator of another part of the same stream
+    def merge(self, other):
+        self.profile += other.profile
+        self.weight += other.weight
+        return self
+
+    def reset(self):
+        self.profile[:] = 0
+        self.weight = 0.0
+
+    # Mean chroma so far
+    def meanChroma(self):
+        return self.profile / self.weight if self.weight > 0 else self.profile.copy()
+
+    # Correlations with all 24 keys, in the order of KEY_NAMES
+    def scores(self):
+        return scores(self.profile)
+
+    # Best matching key so far as (name, correlation)
+    def key(self):
+        return estimate(self.profile)
+
+
+def estimateAudio(audio_data, frame_size=4096, hop_size=2048, chunk_frames=None):
+    """
+    Estimate the key of a signal, streaming its STFT chunk_frames frames at a time
+    (by default 1024, or as many as fit in the memory budget).
+    Returns (name, correlation).
+    """
+    if chunk_frames is None:
+        chunk_frames = Budget.stftChunkFrames(frame_size, 1024)
+
+    samples = numpy.asarray(audio_data)
+    num_frames = max(1, 1 + (len(samples) - frame_size) // hop_size)
+    estimator = KeyEstimator()
+    for start in range(0, num_frames, chunk_frames):
+        end = min(start + chunk_frames, num_frames)
+        chunk = samples[start * hop_size:(end - 1) * hop_size + frame_size]
+        estimator.updateSpectra(Transforms.stft(chunk, frame_size, hop_size), audio_data.sampleRate)
+
+    return estimator.key()
@@ -1,6 +1,7 @@
 """
 MFCC methods
 Compute Mel-Frequency Cepstral Coefficients
+and (log-)mel spectrograms for model input
 Ported from https://github.com/jsawruk/pymir: 29 August 2017
 """
 
@@ -9,6 +10,8 @@ import numpy
 import scipy
 from numpy import log
 
+from pymir3x import Budget, Transforms
+
 
 def mfcc2(spectrum, num_filters=32):
     """
@@ -53,9 +56,9 @@ def fbwin(x, fs, f1, f2, f3):
 def mfcc(spectrum, m, num_filters=48):
     """
     Compute the Mth Mel-Frequency Cepstral Coefficient
+    Vectorized over the cached filterParameters matrix; Reference.mfcc is the
+    original loop (see Equivalence.py)
     """
-    outer_sum = 0
-
     bin_size = len(spectrum)
 
     if m >= num_filters:
@@ -63,24 +66,53 @@ def mfcc(spectrum, m, num_filters=48):
 
     result = normalizationFactor(num_filters, m)
 
-    for filter_band in range(1, num_filters + 1):
-        # Compute inner sum
-        inner_sum = 0
-        for frequency_band in range(0, bin_size - 1):
-            inner_sum = inner_sum + abs(spectrum[frequency_band] * filterParameter(bin_size, frequency_band, filter_band, spectrum.sampleRate))
+    # The filter parameters are non-negative, so |X[k] * H[l, k]| = |X[k]| * H[l, k]
+    magnitudes = numpy.abs(numpy.asarray(spectrum)[:bin_size - 1])
+    inner_sums = numpy.dot(filterParameters(bin_size, spectrum.sampleRate, num_filters), magnitudes)
 
-        if inner_sum > 0:
-            inner_sum = log(inner_sum)  # The log of 0 is undefined, so don't use it
+    # The log of 0 is undefined, so don't use it
+    positive = inner_sums > 0
+    inner_sums[positive] = log(inner_sums[positive])
 
-        inner_sum = inner_sum * math.cos(((m * math.pi) / num_filters) * (filter_band - 0.5))
-
-        outer_sum = outer_sum + inner_sum
+    filter_bands = numpy.arange(1, num_filters + 1)
+    outer_sum = numpy.dot(inner_sums, numpy.cos(((m * math.pi) / num_filters) * (filter_bands - 0.5)))
 
     result = result * outer_sum
 
     return result
 
 
+_filter_parameters = {}
+
+
+def filterParameters(bin_size, sampling_rate, num_filters):
+    """
+    Intermediate computation used by the mfcc function.
+    Return the (num_filters, bin_size - 1) matrix of filterParameter values for
+    filter bands 1..num_filters and frequency bands 0..bin_size - 2. Cached.
+    """
+    key = (bin_size, sampling_rate, num_filters)
+    if key not in _filter_parameters:
+        boundary = (numpy.arange(bin_size - 1) * sampling_rate) / float(bin_size)  # k * Fs / N
+        parameters = numpy.zeros((num_filters, bin_size - 1))
+
+        for filter_band in range(1, num_filters + 1):
+            prev_center_frequency = getCenterFrequency(filter_band - 1)  # fc(l - 1)
+            this_center_frequency = getCenterFrequency(filter_band)  # fc(l)
+            next_center_frequency = getCenterFrequency(filter_band + 1)  # fc(l + 1)
+            magnitude_factor = getMagnitudeFactor(filter_band)
+
+            rising = (boundary >= prev_center_frequency) & (boundary < this_center_frequency)
+            parameters[filter_band - 1, rising] = (boundary[rising] - prev_center_frequency) / (this_center_frequency - prev_center_frequency) * magnitude_factor
+
+            falling = (boundary >= this_center_frequency) & (boundary < next_center_frequency)
+            parameters[filter_band - 1, falling] = (boundary[falling] - next_center_frequency) / (this_center_frequency - next_center_frequency) * magnitude_factor
+
+        _filter_parameters[key] = parameters
+
+    return _filter_parameters[key]
+
+
 def normalizationFactor(num_filters, m):
     """
     Intermediate computation used by mfcc function.
@@ -154,3 +186,111 @@ def getCenterFrequency(filter_band):
         center_frequency = center_frequency * 1073.4
 
     return center_frequency
+
+
+def hzToMel(frequency):
+    """
+    Convert a frequency in Hertz to mels (HTK formula)
+    """
+    return 2595.0 * numpy.log10(1.0 + numpy.asarray(frequency, dtype=numpy.float64) / 700.0)
+
+
+def melToHz(mel):
+    """
+    Convert mels to a frequency in Hertz (HTK formula)
+    """
+    return 700.0 * (10.0 ** (numpy.asarray(mel, dtype=numpy.float64) / 2595.0) - 1.0)
+
+
+_mel_filterbanks = {}
+
+
+def melFilterbank(sample_rate, frame_size, n_mels=40, fmin=0.0, fmax=None):
+    """
+    Return the (frame_size // 2 + 1, n_mels) float32 matrix of triangular mel
+    filters, equally spaced on the mel scale between fmin and fmax (default
+    sample_rate / 2) and normalized to equal area. Cached and read-only.
+    """
+    if fmax is None:
+        fmax = sample_rate / 2.0
+
+    key = (sample_rate, frame_size, n_mels, fmin, fmax)
+    if key not in _mel_filterbanks:
+        bin_frequencies = numpy.arange(frame_size // 2 + 1) * sample_rate / float(frame_size)
+        edges = melToHz(numpy.linspace(hzToMel(fmin), hzToMel(fmax), n_mels + 2))
+        lower = edges[:-2]
+        centre = edges[1:-1]
+        upper = edges[2:]
+
+        rising = (bin_frequencies[:, None] - lower) / (centre - lower)
+        falling = (upper - bin_frequencies[:, None]) / (upper - centre)
+        weights = numpy.maximum(0, numpy.minimum(rising, falling)) * (2.0 / (upper - lower))
+
+        filterbank = numpy.ascontiguousarray(weights, dtype=numpy.float32)
+        filterbank.flags.writeable = False
+        _mel_filterbanks[key] = filterbank
+
+    return _mel_filterbanks[key]
+
+
+def _melFrames(samples, first_frame, out, frame_size, hop_size, filterbank, power, log_floor):
+    """
+    Compute the mel spectra of len(out) frames starting at first_frame into out
+    (a C-contiguous float32 block), taking the log in place if log_floor is set.
+    """
+    chunk = samples[first_frame * hop_size:(first_frame + len(out) - 1) * hop_size + frame_size]
+    magnitudes = numpy.abs(Transforms.stft(chunk, frame_size, hop_size)).astype(numpy.float32)
+    if power != 1:
+        magnitudes **= power
+
+    numpy.dot(magnitudes, filterbank, out=out)
+    if log_floor:
+        numpy.maximum(out, log_floor, out=out)
+        numpy.log(out, out=out)
+
+
+def melSpectrogram(audio_data, frame_size=2048, hop_size=512, n_mels=40, fmin=0.0, fmax=None, power=2.0,
+                   log_floor=1e-10, chunk_frames=None):
+    """
+    Compute the (log-)mel spectrogram of a signal as one C-contiguous float32
+    (num_frames, n_mels) matrix, ready to hand to a model. Frame i starts at
+    sample i * hop_size. The STFT is computed chunk_frames frames at a time (by
+    default 1024, or as many as fit in the memory budget) directly into the
+    result; the log is taken in place after flooring at log_floor (None or 0
+    for a linear mel spectrogram).
+    """
+    if chunk_frames is None:
+        chunk_frames = Budget.stftChunkFrames(frame_size, 1024)
+
+    samples = numpy.asarray(audio_data)
+    filterbank = melFilterbank(audio_data.sampleRate, frame_size, n_mels, fmin, fmax)
+    num_frames = max(1, 1 + (len(samples) - frame_size) // hop_size)
+
+    mel_spectrogram = numpy.empty((num_frames, n_mels), dtype=numpy.float32)
+    for start in range(0, num_frames, chunk_frames):
+        end = min(start + chunk_frames, num_frames)
+        _melFrames(samples, start, mel_spectrogram[start:end], frame_size, hop_size, filterbank, power, log_floor)
+
+    return mel_spectrogram
+
+
+def melChunks(audio_data, chunk_frames=256, frame_size=2048, hop_size=512, n_mels=40, fmin=0.0, fmax=None,
+              power=2.0, log_floor=1e-10):
+    """
+    Emit the (log-)mel spectrogram as fixed-size C-contiguous float32 blocks of
+    (chunk_frames, n_mels), e.g. for batched requests to an inference server.
+    The last block is padded with the floor value (log(log_floor), or 0).
+    Yields (first_frame, block, num_valid_frames); every block is a new array.
+    """
+    samples = numpy.asarray(audio_data)
+    filterbank = melFilterbank(audio_data.sampleRate, frame_size, n_mels, fmin, fmax)
+    num_frames = max(1, 1 + (len(samples) - frame_size) // hop_size)
+    padding = math.log(log_floor) if log_floor else 0.0
+
+    for start in range(0, num_frames, chunk_frames):
+        num_valid = min(chunk_frames, num_frames - start)
+        block = numpy.empty((chunk_frames, n_mels), dtype=numpy.float32)
+        _melFrames(samples, start, block[:num_valid], frame_size, hop_size, filterbank, power, log_floor)
+        block[num_valid:] = padding
+
+        yield start, block, num_valid
@@ -0,0 +1,101 @@
+"""
+Metadata.py
+Shared, immutable signal metadata for the Frame, AudioFile and Spectrum classes
+Every array holds a reference to a single Metadata object instead of separate
+sampleRate/channels/format attributes. Views, slices and ufunc results inherit
+the reference with one attribute lookup in __array_finalize__, and setting an
+attribute replaces the reference of that array only.
+
+Internal kernels can work on plain ndarray views (plain) and attach the
+metadata to their result once (wrap), which avoids the subclass overhead on
+every intermediate operation.
+"""
+
+import numpy
+
+
+class Metadata(object):
+    __slots__ = ('sampleRate', 'channels', 'format')
+
+    def __init__(self, sampleRate=None, channels=None, format=None):
+        object.__setattr__(self, 'sampleRate', sampleRate)
+        object.__setattr__(self, 'channels', channels)
+        object.__setattr__(self, 'format', format)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Metadata is immutable; use replace()")
+
+    def __reduce__(self):
+        return Metadata, (self.sampleRate, self.channels, self.format)
+
+    def __eq__(self, other):
+        return (isinstance(other, Metadata) and self.sampleRate == other.sampleRate and
+                self.channels == other.channels and self.format == other.format)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.sampleRate, self.channels, self.format))
+
+    def __repr__(self):
+        return "Metadata(sampleRate=%r, channels=%r, format=%r)" % (self.sampleRate, self.channels, self.format)
+
+    # Return a copy with the given attributes changed
+    def replace(self, **changes):
+        values = {'sampleRate': self.sampleRate, 'channels': self.channels, 'format': self.format}
+        values.update(changes)
+        return Metadata(**values)
+
+
+# Metadata of arrays created by view casting from a plain ndarray
+EMPTY = Metadata()
+
+
+def attribute(name):
+    """
+    Create a property exposing one attribute of an array's metadata.
+    Assigning it replaces the array's metadata with an updated copy.
+    """
+    def getter(self):
+        return getattr(self.metadata, name)
+
+    def setter(self, value):
+        self.metadata = self.metadata.replace(**{name: value})
+
+    return property(getter, setter)
+
+
+def plain(array):
+    """
+    Return a plain ndarray view of a Frame/AudioFile/Spectrum, for use inside kernels.
+    """
+    return array.view(numpy.ndarray)
+
+
+def wrap(array, cls, metadata):
+    """
+    View an ndarray as cls (e.g. pymir3x.Frame) carrying the given metadata.
+    """
+    result = array.view(cls)
+    result.metadata = metadata
+    return result
+
+
+def reduce(array):
+    """
+    __reduce__ implementation that keeps the metadata when an array is pickled.
+    """
+    reconstruct, arguments, state = numpy.ndarray.__reduce__(array)
+    return reconstruct, arguments, (state, array.metadata)
+
+
+def setstate(array, state):
+    """
+    __setstate__ counterpart of reduce().
+    """
+    if len(state) == 2 and isinstance(state[1], Metadata):
+        numpy.ndarray.__setstate__(array, state[0])
+        array.metadata = state[1]
+    else:
+        numpy.ndarray.__setstate__(array, state)
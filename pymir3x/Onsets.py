@@ -3,14 +3,17 @@ Compute onset times from time-domain audio data
 Spectra are computed as necessary
 Supported methods:
 - Time-domain: energy
-- Spectral: flux
+- Spectral: flux, hfc (high-frequency content), complex (complex-domain),
+  phase (phase deviation)
+The hfc, complex and phase detection functions are all computed from one
+batched complex spectrogram, so several of them cost a single STFT.
 
 Ported from https://github.com/jsawruk/pymir: 30 August 2017
 """
 
 import numpy
 
-from pymir3x import Energy, SpectralFlux
+from pymir3x import Energy, Tempo, Transforms
 
 
 def onsets(audio_data, method='energy'):
@@ -19,6 +22,8 @@ def onsets(audio_data, method='energy'):
         audio_onsets = onsetsByEnergy(audio_data)
     elif method == 'flux':
         audio_onsets = onsetsByFlux(audio_data)
+    elif method in DETECTION_FUNCTIONS:
+        audio_onsets = onsetsByDetectionFunction(audio_data, method)
 
     return audio_onsets
 
@@ -31,22 +36,114 @@ def onsetsByEnergy(audio_data, frame_size=512):
     return peaks
 
 
-# Compute onsets by using spectral flux
-def onsetsByFlux(audio_data, frame_size=1024):
-    frames = audio_data.frames(frame_size)
+# Compute onsets by using the rectified spectral flux, one value per frame of hop_size
+# samples. The spectrogram is computed in chunks within the memory budget (see
+# Tempo.onsetStrength). Returns onset positions in samples.
+def onsetsByFlux(audio_data, frame_size=1024, hop_size=512):
+    flux, _ = Tempo.onsetStrength(audio_data, frame_size, hop_size, log_compression=None)
 
-    # Compute the spectra of each frame
-    spectra = [f.spectrum() for f in frames]
+    peaks = peakPicking(flux, window_size=10)
+    peaks = [hop_size * p for p in peaks]
 
-    # Compute the spectral flux
-    flux = SpectralFlux.spectralFlux(spectra, rectify=True)
+    return peaks
 
-    peaks = peakPicking(flux, window_size=10)
-    peaks = [frame_size * p for p in peaks]
+
+# Compute onsets with a spectral detection function: 'hfc', 'complex' or 'phase'.
+# Returns onset positions in samples.
+def onsetsByDetectionFunction(audio_data, method='hfc', frame_size=1024, hop_size=512):
+    curve = detectionFunctions(audio_data, [method], frame_size, hop_size)[method]
+
+    peaks = peakPicking(curve, window_size=10)
+    peaks = [hop_size * p for p in peaks]
 
     return peaks
 
 
+def detectionFunctions(audio_data, methods=('hfc', 'complex', 'phase'), frame_size=1024, hop_size=512):
+    """
+    Compute several detection functions from a single batched STFT.
+    Returns a dict of method -> one value per frame of hop_size samples.
+    """
+    spectra = Transforms.stft(audio_data, frame_size, hop_size)
+    return dict((method, DETECTION_FUNCTIONS[method](spectra)) for method in methods)
+
+
+def highFrequencyContent(spectra):
+    """
+    High-frequency content (Masri, 1996): the energy of every frame weighted by
+    bin number, which emphasizes the broadband bursts of percussive onsets.
+    """
+    power = spectra.real ** 2 + spectra.imag ** 2
+    return numpy.dot(power, numpy.arange(spectra.shape[1], dtype=numpy.float64))
+
+
+def _unwrappedPhase(spectra):
+    """
+    Phase of every bin unwrapped along time, so that linear prediction across
+    frames is not broken by jumps of 2 pi.
+    """
+    return numpy.unwrap(numpy.angle(spectra), axis=0)
+
+
+def _principalArgument(phase):
+    """
+    Map phases to [-pi, pi).
+    """
+    return numpy.mod(phase + numpy.pi, 2 * numpy.pi) - numpy.pi
+
+
+def complexDomain(spectra, rectify=False):
+    """
+    Complex-domain detection function (Bello et al., 2004): the distance of every
+    frame from its prediction, with the magnitude of the previous frame and the
+    phase extrapolated from the previous two. With rectify, only bins whose
+    magnitude grows count (Dixon, 2006), so offsets are ignored.
+    The first two frames have no prediction and are 0.
+    """
+    curve = numpy.zeros(len(spectra))
+    if len(spectra) < 3:
+        return curve
+
+    magnitudes = numpy.abs(spectra)
+    phase = _unwrappedPhase(spectra)
+    predicted_phase = 2 * phase[1:-1] - phase[:-2]
+    predicted = magnitudes[1:-1] * numpy.exp(1j * predicted_phase)
+
+    distance = numpy.abs(spectra[2:] - predicted)
+    if rectify:
+        distance[magnitudes[2:] < magnitudes[1:-1]] = 0
+
+    curve[2:] = distance.sum(axis=1)
+    return curve
+
+
+def phaseDeviation(spectra, weighted=False):
+    """
+    Phase-deviation detection function (Bello & Sandler, 2003): the mean absolute
+    deviation of every bin's phase from linear extrapolation, i.e. the wrapped
+    second difference of the unwrapped phase. With weighted, bins are weighted
+    by their magnitude (Dixon, 2006) so that noise in quiet bins counts less.
+    The first two frames are 0.
+    """
+    curve = numpy.zeros(len(spectra))
+    if len(spectra) < 3:
+        return curve
+
+    phase = _unwrappedPhase(spectra)
+    deviation = numpy.abs(_principalArgument(phase[2:] - 2 * phase[1:-1] + phase[:-2]))
+    if weighted:
+        magnitudes = numpy.abs(spectra[2:])
+        curve[2:] = (deviation * magnitudes).sum(axis=1) / spectra.shape[1]
+    else:
+        curve[2:] = deviation.mean(axis=1)
+
+    return curve
+
+
+# Detection functions of the spectral methods, computed from a complex spectrogram
+DETECTION_FUNCTIONS = {'hfc': highFrequencyContent, 'complex': complexDomain, 'phase': phaseDeviation}
+
+
 def peakPicking(audio_onsets, window_size=1024):
     peaks = peaksAboveAverage(audio_onsets, window_size)
     return peaks
@@ -64,7 +161,7 @@ def peaksAboveAverage(data, window_size):
     data_average = numpy.average(data)
     data_average = data_average * 1
 
-    slide_amount = window_size / 2
+    slide_amount = max(1, window_size // 2)
 
     start = 0
     end = window_size
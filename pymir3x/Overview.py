@@ -0,0 +1,213 @@
+"""
+Overview.py
+Multi-resolution waveform overview (min/max/RMS envelope pyramid)
+Level 0 holds the minimum, maximum and RMS of every block of base_block
+samples; each further level halves the resolution by combining pairs of
+blocks of the level below. The pyramid is built in one vectorized pass over
+the signal and can be saved next to the audio file, so that drawing or
+serving any time range at any zoom level only touches O(pixels) values.
+
+Usage:
+    overview = Overview.build(audio_file)
+    overview.save(Overview.overviewFilename(filename))
+    times, minima, maxima, rms = overview.query(60.0, 120.0, 1600)
+"""
+
+import math
+import matplotlib.pyplot as plt
+import numpy
+
+from pymir3x import Budget
+
+BLOCKS_PER_PIXEL = 4
+
+
+def overviewFilename(audio_filename):
+    """
+    Return the file name under which the overview of an audio file is stored.
+    """
+    return audio_filename + '.overview.npz'
+
+
+class Overview(object):
+    """
+    A min/max/RMS pyramid of a signal of length samples. minima[j], maxima[j]
+    and rms[j] are float32 arrays with one value per block of base_block * 2 ** j
+    samples (the last block of each level may be partial). samples is an optional
+    reference to the signal, used when zooming in closer than one block per pixel.
+    """
+
+    def __init__(self, minima, maxima, rms, length, sample_rate, base_block, samples=None):
+        self.minima = minima
+        self.maxima = maxima
+        self.rms = rms
+        self.length = length
+        self.sample_rate = sample_rate
+        self.base_block = base_block
+        self.samples = samples
+
+    def numLevels(self):
+        return len(self.minima)
+
+    # Number of samples in each block of the given level
+    def blockSize(self, level):
+        return self.base_block * 2 ** level
+
+    # Number of samples in every block of the given level; only the last may be partial
+    def _counts(self, level):
+        block = self.blockSize(level)
+        counts = numpy.full(len(self.minima[level]), block, dtype=numpy.float64)
+        counts[-1] = max(1, self.length - block * (len(counts) - 1))
+        return counts
+
+    # Return (times, minima, maxima, rms) with one value per pixel for the time
+    # range [start_time, end_time) in seconds, drawn pixels wide. The coarsest
+    # level with at least BLOCKS_PER_PIXEL blocks per pixel is used, so that blocks
+    # straddling pixel edges barely blur the envelope; times are pixel start times.
+    # A range starting at or past the end of the signal (or an empty signal) is empty.
+    def query(self, start_time=0.0, end_time=None, pixels=1000):
+        start = max(0, int(start_time * self.sample_rate))
+        if start >= self.length:
+            empty = numpy.zeros(0, dtype=numpy.float32)
+            return numpy.zeros(0), empty, empty.copy(), empty.copy()
+
+        end = self.length if end_time is None else min(self.length, int(math.ceil(end_time * self.sample_rate)))
+        end = max(end, start + 1)
+        pixels = max(1, min(pixels, end - start))
+
+        # Pixel boundaries in samples
+        edges = start + (numpy.arange(pixels + 1) * (end - start)) // pixels
+        times = edges[:-1] / float(self.sample_rate)
+        samples_per_pixel = (end - start) / float(pixels)
+
+        if samples_per_pixel < self.base_block and self.samples is not None:
+            return (times,) + self._fromSamples(edges)
+
+        level = int(math.floor(math.log(max(samples_per_pixel / (BLOCKS_PER_PIXEL * self.base_block), 1), 2)))
+        level = min(level, self.numLevels() - 1)
+        block = self.blockSize(level)
+
+        # Blocks overlapping each pixel; a block that straddles a pixel edge counts for both
+        first = edges[:-1] // block
+        last = numpy.maximum((edges[1:] - 1) // block, first)
+        lo = first[0]
+        hi = last[-1] + 1
+
+        minima = self.minima[level][lo:hi]
+        maxima = self.maxima[level][lo:hi]
+        counts = self._counts(level)[lo:hi]
+        squares = self.rms[level][lo:hi].astype(numpy.float64) ** 2 * counts
+
+        # reduceat covers each pixel's blocks up to the next pixel's first block
+        pixel_min = numpy.minimum.reduceat(minima, first - lo)
+        pixel_max = numpy.maximum.reduceat(maxima, first - lo)
+        pixel_squares = numpy.add.reduceat(squares, first - lo)
+        pixel_counts = numpy.add.reduceat(counts, first - lo)
+
+        # A block straddling the edge to the next pixel also belongs to this one
+        shared = numpy.flatnonzero((last[:-1] == first[1:]) & (first[1:] > first[:-1]))
+        blocks = last[shared] - lo
+        pixel_min[shared] = numpy.minimum(pixel_min[shared], minima[blocks])
+        pixel_max[shared] = numpy.maximum(pixel_max[shared], maxima[blocks])
+        pixel_squares[shared] += squares[blocks]
+        pixel_counts[shared] += counts[blocks]
+
+        return times, pixel_min, pixel_max, numpy.sqrt(pixel_squares / pixel_counts).astype(numpy.float32)
+
+    # Exact envelope from the samples, for ranges shorter than one block per pixel
+    def _fromSamples(self, edges):
+        segment = numpy.asarray(self.samples[edges[0]:edges[-1]], dtype=numpy.float64)
+        starts = edges[:-1] - edges[0]
+        minima = numpy.minimum.reduceat(segment, starts)
+        maxima = numpy.maximum.reduceat(segment, starts)
+        rms = numpy.sqrt(numpy.add.reduceat(segment ** 2, starts) / numpy.diff(edges))
+        return minima.astype(numpy.float32), maxima.astype(numpy.float32), rms.astype(numpy.float32)
+
+    # Plot the time range [start_time, end_time) pixels wide: min/max band and RMS band
+    def plot(self, start_time=0.0, end_time=None, pixels=1600, axes=None):
+        times, minima, maxima, rms = self.query(start_time, end_time, pixels)
+        show = axes is None
+        if axes is None:
+            axes = plt.gca()
+
+        axes.fill_between(times, minima, maxima, step='post', linewidth=0)
+        axes.fill_between(times, -rms, rms, step='post', linewidth=0, alpha=0.5)
+        axes.set_xlim(start_time, end_time if end_time is not None else self.length / float(self.sample_rate))
+        axes.set_ylim(-1.5, 1.5)
+        if show:
+            plt.show()
+        return axes
+
+    # Store the pyramid (not the samples) as a .npz file
+    def save(self, filename):
+        arrays = {'length': numpy.array(self.length), 'sample_rate': numpy.array(self.sample_rate),
+                  'base_block': numpy.array(self.base_block)}
+        for level in range(self.numLevels()):
+            arrays['min%d' % level] = self.minima[level]
+            arrays['max%d' % level] = self.maxima[level]
+            arrays['rms%d' % level] = self.rms[level]
+
+        with open(filename, 'wb') as f:
+            numpy.savez(f, **arrays)
+
+    # Load a pyramid stored by save(); samples may be given for closest zoom levels
+    @staticmethod
+    def load(filename, samples=None):
+        with numpy.load(filename) as data:
+            num_levels = len([name for name in data.files if name.startswith('min')])
+            minima = [data['min%d' % level] for level in range(num_levels)]
+            maxima = [data['max%d' % level] for level in range(num_levels)]
+            rms = [data['rms%d' % level] for level in range(num_levels)]
+            return Overview(minima, maxima, rms, int(data['length']), data['sample_rate'].item(),
+                            int(data['base_block']), samples)
+
+
+def build(audio_data, base_block=64, sample_rate=None):
+    """
+    Build the overview pyramid of a signal. Level 0 is computed block-aligned
+    chunk by chunk (as large as the memory budget allows, see Budget); the
+    higher levels are pairwise reductions of the level below, down to a single block.
+    """
+    if sample_rate is None:
+        sample_rate = audio_data.sampleRate
+
+    samples = numpy.asarray(audio_data)
+    length = len(samples)
+    num_blocks = max(1, -(-length // base_block))
+
+    minima = numpy.empty(num_blocks, dtype=numpy.float32)
+    maxima = numpy.empty(num_blocks, dtype=numpy.float32)
+    sums = numpy.zeros(num_blocks)
+    if length == 0:
+        minima[:] = 0
+        maxima[:] = 0
+    else:
+        # Each block costs a float64 copy of its samples and their squares
+        chunk_blocks = Budget.chunkLength(16 * base_block, num_blocks)
+        for first in range(0, num_blocks, chunk_blocks):
+            last = min(first + chunk_blocks, num_blocks)
+            chunk = numpy.asarray(samples[first * base_block:last * base_block], dtype=numpy.float64)
+            starts = numpy.arange(0, len(chunk), base_block)
+            minima[first:last] = numpy.minimum.reduceat(chunk, starts)
+            maxima[first:last] = numpy.maximum.reduceat(chunk, starts)
+            sums[first:last] = numpy.add.reduceat(chunk ** 2, starts)
+
+    counts = numpy.full(num_blocks, base_block, dtype=numpy.float64)
+    counts[-1] = max(1, length - base_block * (num_blocks - 1))
+
+    level_minima = [minima]
+    level_maxima = [maxima]
+    level_rms = [numpy.sqrt(sums / counts).astype(numpy.float32)]
+    while len(minima) > 1:
+        # Pair up blocks; an odd last block is carried over on its own
+        pairs = len(minima) // 2
+        minima = numpy.concatenate((numpy.minimum(minima[0:2 * pairs:2], minima[1:2 * pairs:2]), minima[2 * pairs:]))
+        maxima = numpy.concatenate((numpy.maximum(maxima[0:2 * pairs:2], maxima[1:2 * pairs:2]), maxima[2 * pairs:]))
+        sums = numpy.concatenate((sums[0:2 * pairs:2] + sums[1:2 * pairs:2], sums[2 * pairs:]))
+        counts = numpy.concatenate((counts[0:2 * pairs:2] + counts[1:2 * pairs:2], counts[2 * pairs:]))
+
+        level_minima.append(minima)
+        level_maxima.append(maxima)
+        level_rms.append(numpy.sqrt(sums / counts).astype(numpy.float32))
+
+    return Overview(level_minima, level_maxima, level_rms, length, sample_rate, base_block, audio_data)
@@ -1,12 +1,15 @@
 """
 Pitch functions
 - Chroma
+- Fundamental frequency tracking (YIN)
 Ported from https://github.com/jsawruk/pymir: 29 August 2017
 """
 
 import math
 import numpy
 
+from pymir3x import Budget, Transforms
+
 
 # Dictionary of major and minor chords
 chords = [{'name': "C", 'vector': [1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0], 'key': 0, 'mode': 1},
@@ -37,27 +40,46 @@ chords = [{'name': "C", 'vector': [1, 0, 0, 0, 1, 0, 0, 1, 0, 0, 0, 0], 'key': 0
 
 
 # Compute the 12-ET chroma vector from this spectrum
+# Vectorized through the cached pitchClassMap; Reference.chroma is the original loop (see Equivalence.py)
 def chroma(spectrum):
-    chroma_vector = [0] * 12
-    for index in range(0, len(spectrum)):
+    magnitudes = numpy.abs(numpy.asarray(spectrum))
+    chroma_vector = numpy.dot(magnitudes, pitchClassMap(len(spectrum), spectrum.sampleRate))
 
-        # Assign a frequency value to each bin
-        f = index * (spectrum.sampleRate / 2.0) / len(spectrum)
+    # Normalize the chroma vector
+    max_element = chroma_vector.max()
+    chroma_vector = list(chroma_vector / max_element)
 
-        # Convert frequency to pitch to pitch class
-        if f != 0:
-            pitch = frequencyToMidi(f)
-        else:
-            pitch = 0
-        pitch_class = pitch % 12
+    return chroma_vector
 
-        chroma_vector[pitch_class] = chroma_vector[pitch_class] + abs(spectrum[index])
 
-    # Normalize the chroma vector
-    max_element = max(chroma_vector)
-    chroma_vector = [c / max_element for c in chroma_vector]
+# Compute the 12-ET chroma vectors of a matrix of spectra (num_frames, num_bins) in one
+# matrix product. Matches chroma() row by row; the bin-to-pitch-class map is cached.
+def chromaMatrix(spectra, sample_rate):
+    magnitudes = numpy.abs(spectra)
+    chroma_matrix = numpy.dot(magnitudes, pitchClassMap(magnitudes.shape[-1], sample_rate))
 
-    return chroma_vector
+    # Normalize each chroma vector by its maximum
+    max_elements = chroma_matrix.max(axis=-1)
+    max_elements[max_elements == 0] = 1
+    return chroma_matrix / max_elements[..., None]
+
+
+_pitch_class_maps = {}
+
+
+# Return the (num_bins, 12) one-hot matrix assigning every spectrum bin to its pitch class
+def pitchClassMap(num_bins, sample_rate):
+    key = (num_bins, sample_rate)
+    if key not in _pitch_class_maps:
+        f = numpy.arange(num_bins) * (sample_rate / 2.0) / num_bins
+        pitch = numpy.zeros(num_bins, dtype=int)
+        pitch[1:] = numpy.round(69 + 12 * numpy.log2(f[1:] / 440.0)).astype(int)
+
+        pitch_class_map = numpy.zeros((num_bins, 12))
+        pitch_class_map[numpy.arange(num_bins), pitch % 12] = 1
+        _pitch_class_maps[key] = pitch_class_map
+
+    return _pitch_class_maps[key]
 
 
 # Compute the similarity between two vectors using the cosine similarity metric
@@ -97,6 +119,124 @@ def getChord(chroma):
 # Compute the pitch by using the naive pitch estimation method, i.e. get the pitch name for the most prominent frequency.
 # Only returns MIDI pitch number
 def naivePitch(spectrum):
-    max_frequency_index = numpy.argmax(spectrum)
+    max_frequency_index = numpy.argmax(abs(spectrum))
     max_frequency = max_frequency_index * (spectrum.sampleRate / 2.0) / len(spectrum)
     return frequencyToMidi(max_frequency)
+
+
+# Track the fundamental frequency of every frame of a signal using the YIN algorithm
+# (de Cheveigne & Kawahara, 2002). Frames are processed block_frames at a time (by
+# default 1024, or as many as fit in the memory budget; see Budget): the difference
+# functions of a block are computed from batched FFT autocorrelations of its frame
+# matrix, so memory does not grow with the length of the signal.
+# Returns (f0, confidence, times), one value per frame. f0 is in Hertz and is 0 for
+# frames without a dip below the threshold (unvoiced); confidence is 1 - d'(tau) at
+# the selected lag; times are frame start times in seconds.
+def yin(audio_data, frame_size=2048, hop_size=512, fmin=60.0, fmax=2000.0, threshold=0.1, block_frames=None):
+    sample_rate = audio_data.sampleRate
+
+    tau_min = max(1, int(math.floor(sample_rate / float(fmax))))
+    tau_max = int(math.ceil(sample_rate / float(fmin)))
+    if tau_max >= frame_size // 2:
+        raise ValueError("frame_size %d is too short for fmin %.1f Hz at %d Hz; use at least %d samples" %
+                         (frame_size, fmin, sample_rate, 2 * tau_max + 2))
+    if tau_min >= tau_max:
+        raise ValueError("fmin must be lower than fmax")
+
+    if block_frames is None:
+        block_frames = yinBlockFrames(frame_size, tau_max)
+
+    frames = Transforms.frameMatrix(numpy.asarray(audio_data, dtype=numpy.float64), frame_size, hop_size)
+    f0 = numpy.empty(len(frames))
+    confidence = numpy.empty(len(frames))
+    for start in range(0, len(frames), block_frames):
+        end = start + block_frames
+        f0[start:end], confidence[start:end] = _yinFrames(frames[start:end], sample_rate, tau_min, tau_max, threshold)
+
+    times = numpy.arange(len(frames)) * hop_size / float(sample_rate)
+    return f0, confidence, times
+
+
+# Number of frames per YIN block: 1024, or under a memory budget as many as fit.
+# Every frame holds two padded FFT inputs, two spectra and their product, the
+# correlation, its squared samples and their cumulative sum, and about six lag curves.
+def yinBlockFrames(frame_size, tau_max):
+    fft_size = _yinFftSize(frame_size, tau_max)
+    num_bins = fft_size // 2 + 1
+    return Budget.chunkLength(24 * fft_size + 48 * num_bins + 16 * frame_size + 48 * (tau_max + 1), 1024)
+
+
+# FFT size of the YIN cross-correlation: the frame plus the integration window
+def _yinFftSize(frame_size, tau_max):
+    fft_size = 1
+    while fft_size < 2 * frame_size - tau_max:
+        fft_size *= 2
+    return fft_size
+
+
+# YIN f0 and confidence of every row of a block of the frame matrix
+def _yinFrames(frames, sample_rate, tau_min, tau_max, threshold):
+    normalized = cumulativeMeanNormalizedDifference(differenceFunction(frames, tau_max))
+
+    # Candidate lags: below the threshold and at the bottom of their dip. The first
+    # candidate of each row is the first local minimum below the threshold.
+    search = normalized[:, tau_min:tau_max + 1]
+    next_value = numpy.empty_like(search)
+    next_value[:, :-1] = search[:, 1:]
+    next_value[:, -1] = numpy.inf
+    candidates = (search < threshold) & (search <= next_value)
+
+    voiced = candidates.any(axis=1)
+    best = numpy.where(voiced, candidates.argmax(axis=1), search.argmin(axis=1))
+    tau = best + tau_min
+
+    # Parabolic interpolation around the selected lag
+    rows = numpy.arange(len(tau))
+    left = normalized[rows, numpy.maximum(tau - 1, 0)]
+    centre = normalized[rows, tau]
+    right = normalized[rows, numpy.minimum(tau + 1, tau_max)]
+    denominator = left - 2 * centre + right
+    interior = (tau > tau_min) & (tau < tau_max) & (denominator > 0)
+    shift = numpy.zeros(len(tau))
+    shift[interior] = 0.5 * (left[interior] - right[interior]) / denominator[interior]
+    refined_tau = tau + numpy.clip(shift, -1, 1)
+
+    f0 = numpy.where(voiced, sample_rate / refined_tau, 0.0)
+    confidence = numpy.clip(1.0 - centre, 0.0, 1.0)
+    return f0, confidence
+
+
+# Compute the YIN difference function d(tau) for tau = 0..tau_max of every row of a
+# frame matrix. The integration window is frame_size - tau_max samples.
+# d(tau) = e(0) + e(tau) - 2 r(tau), with the cross-correlation r computed by FFT.
+def differenceFunction(frames, tau_max):
+    frame_size = frames.shape[1]
+    window_size = frame_size - tau_max
+
+    fft_size = _yinFftSize(frame_size, tau_max)
+
+    spectra = numpy.fft.rfft(frames, fft_size, axis=1)
+    window_spectra = numpy.fft.rfft(frames[:, :window_size], fft_size, axis=1)
+    correlation = numpy.fft.irfft(numpy.conj(window_spectra) * spectra, fft_size, axis=1)[:, :tau_max + 1]
+
+    # Windowed energies e(tau) = sum(x[tau:tau + window_size] ** 2) from a cumulative sum
+    cumulative = numpy.zeros((frames.shape[0], frame_size + 1))
+    numpy.cumsum(frames ** 2, axis=1, out=cumulative[:, 1:])
+    energy = cumulative[:, window_size:window_size + tau_max + 1] - cumulative[:, :tau_max + 1]
+
+    difference = energy[:, :1] + energy - 2 * correlation
+    numpy.maximum(difference, 0, out=difference)
+    difference[:, 0] = 0
+    return difference
+
+
+# Compute the cumulative mean normalized difference d'(tau) of a difference function matrix
+def cumulativeMeanNormalizedDifference(difference):
+    normalized = numpy.ones_like(difference)
+    cumulative = numpy.cumsum(difference[:, 1:], axis=1)
+    lags = numpy.arange(1, difference.shape[1])
+
+    nonzero = cumulative > 0
+    scaled = difference[:, 1:] * lags
+    normalized[:, 1:][nonzero] = scaled[nonzero] / cumulative[nonzero]
+    return normalized
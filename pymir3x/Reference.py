@@ -0,0 +1,161 @@
+"""
+Reference.py
+Reference (loop-based) implementations of kernels that have vectorized fast paths
+These are the original implementations, kept unchanged so that the fast paths
+can be checked against them (see Equivalence.py). Do not optimize them.
+- centroid: Spectrum.centroid
+- mfcc: MFCC.mfcc
+- chroma: Pitch.chroma
+- spectralFlux: SpectralFlux.spectralFlux
+- zcr: Frame.zcr
+- cqt: Transforms.cqt
+Ported from https://github.com/jsawruk/pymir: 29 August 2017
+"""
+
+import math
+from numpy import abs, array, cos, log, pi, sqrt, zeros
+
+from pymir3x import MFCC, Pitch
+
+
+def centroid(spectrum):
+    """
+    Compute the spectral centroid
+    """
+    bin_number = 0
+
+    numerator = 0
+    denominator = 0
+
+    for nth_bin in spectrum:    # 'nth_bin' is used to prevent shadowing of the 'bin' keyword
+        # Compute center frequency
+        f = (spectrum.sampleRate / 2.0) / len(spectrum)
+        f = f * bin_number
+
+        numerator = numerator + (f * abs(nth_bin))
+        denominator = denominator + abs(nth_bin)
+
+        bin_number = bin_number + 1
+
+    return (numerator * 1.0) / denominator
+
+
+def mfcc(spectrum, m, num_filters=48):
+    """
+    Compute the Mth Mel-Frequency Cepstral Coefficient
+    """
+    outer_sum = 0
+
+    bin_size = len(spectrum)
+
+    if m >= num_filters:
+        return 0  # This represents an error condition - the specified coefficient is greater than or equal to the number of filters. The behavior in this case is undefined.
+
+    result = MFCC.normalizationFactor(num_filters, m)
+
+    for filter_band in range(1, num_filters + 1):
+        # Compute inner sum
+        inner_sum = 0
+        for frequency_band in range(0, bin_size - 1):
+            inner_sum = inner_sum + abs(spectrum[frequency_band] * MFCC.filterParameter(bin_size, frequency_band, filter_band, spectrum.sampleRate))
+
+        if inner_sum > 0:
+            inner_sum = log(inner_sum)  # The log of 0 is undefined, so don't use it
+
+        inner_sum = inner_sum * math.cos(((m * math.pi) / num_filters) * (filter_band - 0.5))
+
+        outer_sum = outer_sum + inner_sum
+
+    result = result * outer_sum
+
+    return result
+
+
+def chroma(spectrum):
+    """
+    Compute the 12-ET chroma vector from this spectrum
+    """
+    chroma_vector = [0] * 12
+    for index in range(0, len(spectrum)):
+
+        # Assign a frequency value to each bin
+        f = index * (spectrum.sampleRate / 2.0) / len(spectrum)
+
+        # Convert frequency to pitch to pitch class
+        if f != 0:
+            pitch = Pitch.frequencyToMidi(f)
+        else:
+            pitch = 0
+        pitch_class = pitch % 12
+
+        chroma_vector[pitch_class] = chroma_vector[pitch_class] + abs(spectrum[index])
+
+    # Normalize the chroma vector
+    max_element = max(chroma_vector)
+    chroma_vector = [c / max_element for c in chroma_vector]
+
+    return chroma_vector
+
+
+def spectralFlux(spectra, rectify=False):
+    """
+    Compute the spectral flux between consecutive spectra
+    """
+    spectral_flux = []
+
+    # Compute flux for zeroth spectrum
+    flux = 0
+    for nth_bin in spectra[0]:
+        flux = flux + abs(nth_bin)
+
+        spectral_flux.append(flux)
+
+    # Compute flux for subsequent spectra
+    for s in range(1, len(spectra)):
+        prev_spectrum = spectra[s - 1]
+        spectrum = spectra[s]
+
+        flux = 0
+        for mth_bin in range(0, len(spectrum)):
+            diff = abs(spectrum[mth_bin]) - abs(prev_spectrum[mth_bin])
+
+            # If rectify is specified, only return positive values
+            if rectify and diff < 0:
+                diff = 0
+
+            flux = flux + diff
+
+            spectral_flux.append(flux)
+
+    return spectral_flux
+
+
+def zcr(frame):
+    """
+    Compute the Zero-crossing rate (ZCR)
+    """
+    zcr = 0
+    for i in range(1, len(frame)):
+        if (frame[i - 1] * frame[i]) < 0:
+            zcr = zcr + 1
+
+    return zcr / (1.0 * len(frame))
+
+
+def cqt(frame):
+    """
+    Constant Q Transform
+    """
+    frame_length = len(frame)
+    y = array(zeros(frame_length))
+    a = sqrt(2 / float(frame_length))
+    for k in range(frame_length):
+        for n in range(frame_length):
+            y[k] += frame[n] * cos(pi * (2 * n + 1) * k / float(2 * frame_length))
+
+            if k == 0:
+                y[k] = y[k] * sqrt(1 / float(frame_length))
+            else:
+                y[k] = y[k] * a
+
+    return y
@@ -0,0 +1,161 @@
+"""
+Segments.py
+Segment table over a parent signal
+A SegmentTable stores segment boundaries as start/end sample index arrays
+instead of a list of sliced frames. Per-segment features are computed for all
+segments at once: sample-level features by chunked segment sums over the signal, and
+spectral features by segment sums over a framewise feature matrix that is
+computed chunk by chunk.
+"""
+
+import numpy
+
+from pymir3x import Budget, Pitch, Transforms
+
+
+class SegmentTable(object):
+    """
+    Segments [starts[i], ends[i]) of the samples of a parent Frame/AudioFile.
+    """
+
+    def __init__(self, audio_data, starts, ends):
+        self.audio_data = audio_data
+        self.sampleRate = audio_data.sampleRate
+        self.starts = numpy.asarray(starts, dtype=numpy.int64)
+        self.ends = numpy.asarray(ends, dtype=numpy.int64)
+
+        if self.starts.shape != self.ends.shape:
+            raise ValueError("starts and ends must have the same length")
+        if numpy.any(self.ends < self.starts):
+            raise ValueError("Segments must not end before they start")
+
+    # Build the table of segments between consecutive onsets
+    # (the same segments as Frame.framesFromOnsets)
+    @staticmethod
+    def fromOnsets(audio_data, onsets):
+        onsets = numpy.clip(numpy.asarray(onsets, dtype=numpy.int64), 0, len(audio_data))
+        return SegmentTable(audio_data, onsets[:-1], onsets[1:])
+
+    def __len__(self):
+        return len(self.starts)
+
+    # Return the samples of segment i as a view of the parent signal
+    def __getitem__(self, i):
+        return self.audio_data[self.starts[i]:self.ends[i]]
+
+    # Segment lengths in samples
+    def lengths(self):
+        return self.ends - self.starts
+
+    # Segment start and end times in seconds
+    def times(self):
+        return self.starts / float(self.sampleRate), self.ends / float(self.sampleRate)
+
+    def _sampleSums(self, values, starts=None, chunk_samples=None):
+        """
+        Sum a per-sample quantity over every segment [starts[i], ends[i]) (starts
+        default to the segment starts). values(lo, hi) returns the quantity for
+        samples lo .. hi - 1. The signal is processed chunk_samples at a time (by
+        default 2 ** 20, or as many as fit in the memory budget) and each segment's
+        share of a chunk is summed with reduceat, so there is no whole-signal
+        intermediate and no running total to lose precision in. Empty segments sum to 0.
+        """
+        if starts is None:
+            starts = self.starts
+        if chunk_samples is None:
+            chunk_samples = Budget.chunkLength(32, 2 ** 20)
+
+        sums = numpy.zeros(len(starts))
+        if len(starts) == 0:
+            return sums
+
+        first = max(0, int(starts.min()))
+        last = min(len(self.audio_data), int(self.ends.max()))
+        for chunk_start in range(first, last, chunk_samples):
+            chunk_end = min(chunk_start + chunk_samples, last)
+            lo = numpy.clip(starts, chunk_start, chunk_end)
+            hi = numpy.clip(self.ends, chunk_start, chunk_end)
+            inside = numpy.flatnonzero(hi > lo)
+            if len(inside) == 0:
+                continue
+
+            # Interleaved (start, end) pairs: every even reduceat entry is one segment's
+            # share of the chunk. The trailing zero keeps end indices in range.
+            chunk_values = numpy.zeros(chunk_end - chunk_start + 1)
+            chunk_values[:-1] = values(chunk_start, chunk_end)
+            indices = numpy.empty(2 * len(inside), dtype=numpy.int64)
+            indices[0::2] = lo[inside] - chunk_start
+            indices[1::2] = hi[inside] - chunk_start
+            sums[inside] += numpy.add.reduceat(chunk_values, indices)[0::2]
+
+        return sums
+
+    # Compute the energy (sum of squared samples) of every segment
+    def energy(self):
+        samples = numpy.asarray(self.audio_data)
+
+        def squares(lo, hi):
+            chunk = numpy.asarray(samples[lo:hi], dtype=numpy.float64)
+            return chunk * chunk
+
+        return self._sampleSums(squares)
+
+    # Compute the root-mean-squared amplitude of every segment. Empty segments are 0.
+    def rms(self):
+        lengths = self.lengths()
+        mean_square = self.energy() / numpy.maximum(lengths, 1)
+        return numpy.sqrt(mean_square)
+
+    # Compute the zero-crossing rate of every segment
+    def zcr(self):
+        samples = numpy.asarray(self.audio_data)
+
+        # 1 where a sample has the opposite sign of the sample before it
+        def crossings(lo, hi):
+            chunk = numpy.asarray(samples[max(lo - 1, 0):hi], dtype=numpy.float64)
+            result = numpy.zeros(hi - lo)
+            changes = (chunk[1:] * chunk[:-1]) < 0
+            result[len(result) - len(changes):] = changes
+            return result
+
+        # A segment only counts crossings within it, not the one into its first
+        # sample from the sample before the segment
+        sums = self._sampleSums(crossings, numpy.minimum(self.starts + 1, self.ends))
+        return sums / numpy.maximum(self.lengths(), 1)
+
+    # Compute the mean magnitude spectrum of every segment.
+    # Frames of frame_size samples are taken every hop_size samples, and every frame
+    # counts towards the segment in which it starts; a segment too short to contain a
+    # frame start uses the frame that covers its start. Frames are transformed
+    # chunk_frames at a time (by default 1024, or as many as fit in the memory budget),
+    # so memory does not grow with the length of the signal.
+    def meanSpectrum(self, frame_size=2048, hop_size=512, window_function=numpy.hanning, chunk_frames=None):
+        if chunk_frames is None:
+            chunk_frames = Budget.stftChunkFrames(frame_size, 1024)
+
+        samples = numpy.asarray(self.audio_data)
+        num_frames = max(1, 1 + (len(samples) - frame_size) // hop_size)
+
+        first_frame = numpy.minimum(-(-self.starts // hop_size), num_frames - 1)
+        last_frame = numpy.minimum(-(-self.ends // hop_size), num_frames)
+        short = last_frame <= first_frame
+        first_frame[short] = numpy.minimum(self.starts[short] // hop_size, num_frames - 1)
+        last_frame[short] = first_frame[short] + 1
+
+        sums = numpy.zeros((len(self), frame_size // 2 + 1))
+        for chunk_start in range(0, num_frames, chunk_frames):
+            chunk_end = min(chunk_start + chunk_frames, num_frames)
+            chunk = samples[chunk_start * hop_size:(chunk_end - 1) * hop_size + frame_size]
+            magnitudes = numpy.abs(Transforms.stft(chunk, frame_size, hop_size, window_function))
+
+            cumulative = numpy.zeros((len(magnitudes) + 1, magnitudes.shape[1]))
+            numpy.cumsum(magnitudes, axis=0, out=cumulative[1:])
+            lo = numpy.clip(first_frame - chunk_start, 0, len(magnitudes))
+            hi = numpy.clip(last_frame - chunk_start, 0, len(magnitudes))
+            sums += cumulative[hi] - cumulative[lo]
+
+        return sums / (last_frame - first_frame)[:, None]
+
+    # Compute the chroma vector of every segment from its mean magnitude spectrum
+    def chroma(self, frame_size=2048, hop_size=512):
+        return Pitch.chromaMatrix(self.meanSpectrum(frame_size, hop_size), self.sampleRate)
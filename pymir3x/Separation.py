@@ -0,0 +1,158 @@
+"""
+Separation.py
+Harmonic/percussive source separation (HPSS) by median filtering (Fitzgerald, 2010)
+Harmonic sounds are smooth along time and percussive sounds are smooth along
+frequency, so median filtering the magnitude spectrogram along each axis
+estimates the two components. Soft (Wiener-like) masks split every
+time-frequency bin between them.
+
+Long signals are processed in blocks of frames with enough context for the
+time-axis median, so block results are identical to whole-file results. One
+pass produces the reconstructed components as well as the chroma of the
+harmonic part and the spectral flux of the percussive part.
+"""
+
+import numpy
+import scipy.ndimage
+
+import pymir3x
+from pymir3x import Budget, Metadata, Pitch, SpectralFlux, Transforms
+
+
+def masks(magnitudes, harmonic_size=17, percussive_size=17, power=2.0):
+    """
+    Compute soft harmonic and percussive masks of a magnitude spectrogram
+    (num_frames, num_bins). The masks sum to 1 in every bin.
+    Returns (harmonic_mask, percussive_mask).
+    """
+    magnitudes = numpy.abs(magnitudes)
+    harmonic = scipy.ndimage.median_filter(magnitudes, size=(harmonic_size, 1), mode='reflect')
+    percussive = scipy.ndimage.median_filter(magnitudes, size=(1, percussive_size), mode='reflect')
+
+    harmonic **= power
+    percussive **= power
+    total = harmonic + percussive
+    total[total == 0] = 1
+    harmonic /= total
+    percussive /= total
+
+    # Bins where both estimates are zero are split evenly
+    silent = (harmonic == 0) & (percussive == 0)
+    harmonic[silent] = 0.5
+    percussive[silent] = 0.5
+    return harmonic, percussive
+
+
+def blocks(audio_data, frame_size=2048, hop_size=512, harmonic_size=17, percussive_size=17, power=2.0,
+           block_frames=None, window_function=numpy.hanning):
+    """
+    Iterate over the STFT of the signal in blocks of frames, with the HPSS masks
+    of every block. The signal is padded with frame_size // 2 zeros at the start
+    and frame_size zeros at the end, so that every sample is covered by frames.
+    By default blocks hold 1024 frames, or as many as fit in the memory budget.
+    Yields (first_frame, spectra, harmonic_mask, percussive_mask).
+    """
+    if block_frames is None:
+        block_frames = blockFrames(frame_size, harmonic_size)
+
+    samples = Metadata.plain(numpy.asarray(audio_data))
+    pad = frame_size // 2
+    padded = numpy.concatenate((numpy.zeros(pad), samples, numpy.zeros(frame_size)))
+    num_frames = 1 + (len(padded) - frame_size) // hop_size
+    context = harmonic_size // 2
+    window = window_function(frame_size)
+
+    for core_start in range(0, num_frames, block_frames):
+        core_end = min(core_start + block_frames, num_frames)
+        lo = max(0, core_start - context)
+        hi = min(num_frames, core_end + context)
+
+        frames = Transforms.frameMatrix(padded[lo * hop_size:(hi - 1) * hop_size + frame_size], frame_size, hop_size)
+        spectra = numpy.fft.rfft(frames * window, axis=1)
+        harmonic_mask, percussive_mask = masks(numpy.abs(spectra), harmonic_size, percussive_size, power)
+
+        core = slice(core_start - lo, core_end - lo)
+        yield core_start, spectra[core], harmonic_mask[core], percussive_mask[core]
+
+
+def blockFrames(frame_size, harmonic_size=17):
+    """
+    Return the number of frames per block: 1024, or under a memory budget as many
+    as fit next to the context frames. Every frame holds its windowed samples,
+    spectrum, two median estimates, two masks, two masked spectra and two
+    resynthesized frames.
+    """
+    num_bins = frame_size // 2 + 1
+    frame_bytes = 8 * frame_size * 3 + num_bins * (16 * 3 + 8 * 5)
+    return Budget.chunkLength(frame_bytes, 1024, overhead=2 * (harmonic_size // 2) * frame_bytes)
+
+
+class HarmonicPercussive(object):
+    """
+    Result of separate(): the harmonic and percussive components as Frames, the
+    per-frame chroma of the harmonic component and the per-frame spectral flux
+    of the percussive component. Frame i is centred on sample i * hop_size.
+    """
+
+    def __init__(self, harmonic, percussive, harmonicChroma, percussiveFlux, hop_size):
+        self.harmonic = harmonic
+        self.percussive = percussive
+        self.harmonicChroma = harmonicChroma
+        self.percussiveFlux = percussiveFlux
+        self.hop_size = hop_size
+
+
+def separate(audio_data, frame_size=2048, hop_size=512, harmonic_size=17, percussive_size=17, power=2.0,
+             block_frames=None, window_function=numpy.hanning):
+    """
+    Separate a signal into harmonic and percussive components in a single blocked
+    pass. The masked spectra are resynthesized by weighted overlap-add; the
+    harmonic magnitudes feed chroma and the percussive magnitudes feed the
+    rectified spectral flux on the way.
+    Returns a HarmonicPercussive result.
+    """
+    sample_rate = audio_data.sampleRate
+    pad = frame_size // 2
+    length = len(audio_data)
+    window = window_function(frame_size)
+
+    output_length = length + pad + frame_size
+    harmonic = numpy.zeros(output_length)
+    percussive = numpy.zeros(output_length)
+    window_sum = numpy.zeros(output_length)
+
+    chroma = []
+    flux = []
+    previous = None
+    for first_frame, spectra, harmonic_mask, percussive_mask in blocks(audio_data, frame_size, hop_size, harmonic_size,
+                                                                       percussive_size, power, block_frames,
+                                                                       window_function):
+        harmonic_spectra = spectra * harmonic_mask
+        percussive_spectra = spectra * percussive_mask
+
+        Transforms.overlapAdd(numpy.fft.irfft(harmonic_spectra, frame_size, axis=1) * window,
+                              hop_size, harmonic, first_frame)
+        Transforms.overlapAdd(numpy.fft.irfft(percussive_spectra, frame_size, axis=1) * window,
+                              hop_size, percussive, first_frame)
+        Transforms.overlapAdd(numpy.tile(window ** 2, (len(spectra), 1)), hop_size, window_sum, first_frame)
+
+        chroma.append(Pitch.chromaMatrix(harmonic_spectra, sample_rate))
+
+        # Carry the last percussive spectrum over so that block boundaries are seamless
+        percussive_magnitudes = numpy.abs(percussive_spectra)
+        if previous is None:
+            flux.append(SpectralFlux.spectralFluxMatrix(percussive_magnitudes, rectify=True))
+        else:
+            flux.append(SpectralFlux.spectralFluxMatrix(numpy.vstack((previous, percussive_magnitudes)), rectify=True)[1:])
+        previous = percussive_magnitudes[-1:]
+
+    # Normalize by the overlapping window energy and remove the padding
+    nonzero = window_sum > 1e-10
+    harmonic[nonzero] /= window_sum[nonzero]
+    percussive[nonzero] /= window_sum[nonzero]
+
+    metadata = getattr(audio_data, 'metadata', Metadata.EMPTY)
+    harmonic = Metadata.wrap(harmonic[pad:pad + length], pymir3x.Frame, metadata)
+    percussive = Metadata.wrap(percussive[pad:pad + length], pymir3x.Frame, metadata)
+
+    return HarmonicPercussive(harmonic, percussive, numpy.vstack(chroma), numpy.concatenate(flux), hop_size)
@@ -0,0 +1,182 @@
+"""
+SharedBuffers.py
+Shared-memory transport of audio buffers and analysis results between processes
+A SharedArray allocates a buffer in multiprocessing.shared_memory (Python 3.8+)
+or in a memory-mapped temporary file, and exposes it as a Frame, AudioFile or
+Spectrum view with its metadata. Only a small picklable Descriptor is sent to
+worker processes, which attach to the same memory and read inputs or write
+results in place; nothing is copied through pickling.
+
+Usage:
+    with SharedBuffers.share(audio_file) as shared_input, \\
+            SharedBuffers.SharedArray((num_frames, 1025), 'complex128', 'Spectrum',
+                                      audio_file.metadata) as shared_output:
+        pool.map(worker, [(shared_input.descriptor, shared_output.descriptor, i) for i in ...])
+        spectrogram = shared_output.array()
+
+    def worker(arguments):
+        input_descriptor, output_descriptor, i = arguments
+        with SharedBuffers.attach(input_descriptor) as signal, SharedBuffers.attach(output_descriptor) as output:
+            output.array()[i] = ...
+
+The creating SharedArray owns the memory: it is released by close(), at the
+end of a with block, or when the owner is garbage collected or the interpreter
+exits.
+"""
+
+import collections
+import mmap
+import os
+import tempfile
+import weakref
+import numpy
+
+import pymir3x
+from pymir3x import Metadata
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8: fall back to memory-mapped files
+    shared_memory = None
+
+# Everything a worker needs to attach to a shared buffer
+Descriptor = collections.namedtuple('Descriptor', ['backend', 'name', 'shape', 'dtype', 'kind', 'metadata'])
+
+KINDS = ('Frame', 'AudioFile', 'Spectrum', 'ndarray')
+
+
+def _openSharedMemory(name):
+    """
+    Attach to an existing shared memory segment. Where supported, the segment is not
+    registered with the resource tracker, since only the owner may unlink it.
+    Child processes of the owner share its resource tracker, so on older Pythons
+    registering again is harmless.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def _release(segment, path, unlink):
+    """
+    Close a shared memory segment or mapped file, and remove it if unlink is set.
+    """
+    if segment is not None:
+        try:
+            segment.close()
+        except BufferError:
+            pass  # Views are still alive; the memory is freed when they are
+        if unlink:
+            try:
+                segment.unlink()
+            except (FileNotFoundError, OSError):
+                pass
+
+    if path is not None and unlink:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class SharedArray(object):
+    """
+    A shared buffer of the given shape and dtype, viewed as kind
+    ('Frame', 'AudioFile', 'Spectrum' or 'ndarray') with the given metadata.
+    backend is 'shm' (multiprocessing.shared_memory) or 'mmap' (a memory-mapped
+    temporary file); by default shm is used where available.
+    """
+
+    def __init__(self, shape, dtype=numpy.float32, kind='Frame', metadata=None, backend=None, _descriptor=None):
+        if _descriptor is None:
+            if kind not in KINDS:
+                raise ValueError("kind must be one of %s" % (KINDS,))
+            if backend is None:
+                backend = 'shm' if shared_memory is not None else 'mmap'
+
+            shape = tuple(int(n) for n in numpy.atleast_1d(shape))
+            dtype = numpy.dtype(dtype)
+            nbytes = max(1, int(numpy.prod(shape)) * dtype.itemsize)
+            owner = True
+
+            if backend == 'shm':
+                if shared_memory is None:
+                    raise ValueError("multiprocessing.shared_memory requires Python 3.8 or later")
+                self._segment = shared_memory.SharedMemory(create=True, size=nbytes)
+                name = self._segment.name
+            elif backend == 'mmap':
+                directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+                handle, name = tempfile.mkstemp(prefix='pymir3x-', dir=directory)
+                os.ftruncate(handle, nbytes)
+                os.close(handle)
+                self._segment = None
+            else:
+                raise ValueError("Unknown backend '%s'" % backend)
+
+            _descriptor = Descriptor(backend, name, shape, dtype.str, kind, metadata)
+        else:
+            owner = False
+            if _descriptor.backend == 'shm':
+                self._segment = _openSharedMemory(_descriptor.name)
+            else:
+                self._segment = None
+
+        self.descriptor = _descriptor
+        self.owner = owner
+
+        if self.descriptor.backend == 'mmap':
+            with open(self.descriptor.name, 'r+b') as f:
+                self._buffer = mmap.mmap(f.fileno(), 0)
+        else:
+            self._buffer = self._segment.buf
+
+        path = self.descriptor.name if self.descriptor.backend == 'mmap' else None
+        self._finalizer = weakref.finalize(self, _release, self._segment, path, owner)
+
+    # Attach to a buffer created in another process
+    @staticmethod
+    def attach(descriptor):
+        return SharedArray(None, _descriptor=descriptor)
+
+    # Return a zero-copy view of the buffer with the metadata attached
+    def array(self):
+        descriptor = self.descriptor
+        view = numpy.ndarray(descriptor.shape, numpy.dtype(descriptor.dtype), buffer=self._buffer)
+        if descriptor.kind == 'ndarray':
+            return view
+
+        return Metadata.wrap(view, getattr(pymir3x, descriptor.kind), descriptor.metadata or Metadata.EMPTY)
+
+    # Detach from the buffer; the owner also frees it. Views returned by array()
+    # must not be used afterwards.
+    def close(self):
+        self._buffer = None
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def attach(descriptor):
+    """
+    Attach to a shared buffer from its descriptor (in a worker process).
+    """
+    return SharedArray.attach(descriptor)
+
+
+def share(array, backend=None):
+    """
+    Copy an existing Frame, AudioFile, Spectrum or ndarray into a new shared
+    buffer with the same shape, dtype, kind and metadata.
+    """
+    kind = type(array).__name__
+    if kind not in KINDS:
+        kind = 'ndarray'
+
+    shared = SharedArray(array.shape, array.dtype, kind, getattr(array, 'metadata', None), backend)
+    shared.array()[...] = array
+    return shared
@@ -0,0 +1,246 @@
+"""
+Similarity.py
+Nearest-neighbour index over track-level feature vectors
+(e.g. MFCC/chroma/centroid summaries) for "find similar tracks" lookups.
+
+Vectors are L2-normalized and stored in one contiguous float32 matrix, so cosine
+similarity is a dot product and a batch of queries is scored with blocked matrix
+products. An optional coarse partitioning layer (spherical k-means, as in an
+inverted-file index) restricts each query to the rows of its nearest partitions.
+"""
+
+import os
+import numpy
+
+
+def _normalize(vectors):
+    """
+    Return a float32 copy of vectors with L2-normalized rows. Zero rows are left as zeros.
+    """
+    vectors = numpy.array(vectors, dtype=numpy.float32, ndmin=2)
+    norms = numpy.sqrt(numpy.einsum('ij,ij->i', vectors, vectors))
+    norms[norms == 0] = 1
+    vectors /= norms[:, None]
+    return vectors
+
+
+def _mergeTopK(best_scores, best_rows, scores, rows, k):
+    """
+    Merge a block of candidate scores (queries, candidates) into the running top-k.
+    """
+    scores = numpy.hstack((best_scores, scores))
+    rows = numpy.hstack((best_rows, rows))
+    if scores.shape[1] > k:
+        keep = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+        query_index = numpy.arange(scores.shape[0])[:, None]
+        scores = scores[query_index, keep]
+        rows = rows[query_index, keep]
+
+    return scores, rows
+
+
+class SimilarityIndex(object):
+    """
+    Cosine-similarity index of feature vectors keyed by integer track ids.
+    """
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.size = 0
+        self.vectors = numpy.zeros((0, dimension), dtype=numpy.float32)
+        self.ids = numpy.zeros(0, dtype=numpy.int64)
+        self.centroids = None
+        self.assignments = numpy.zeros(0, dtype=numpy.int32)
+        self._rows = {}
+        self._lists = None
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, capacity):
+        if capacity <= len(self.vectors) and self.vectors.flags.writeable:
+            return
+
+        capacity = max(capacity, 2 * len(self.vectors), 1024)
+        vectors = numpy.zeros((capacity, self.dimension), dtype=numpy.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        ids = numpy.zeros(capacity, dtype=numpy.int64)
+        ids[:self.size] = self.ids[:self.size]
+        assignments = numpy.zeros(capacity, dtype=numpy.int32)
+        assignments[:self.size] = self.assignments[:self.size]
+        self.vectors, self.ids, self.assignments = vectors, ids, assignments
+
+    # Add (or replace) the feature vectors of the given track ids. An id may appear
+    # only once per call.
+    def add(self, ids, vectors):
+        ids = numpy.atleast_1d(numpy.asarray(ids, dtype=numpy.int64))
+        vectors = _normalize(vectors)
+        if vectors.shape != (len(ids), self.dimension):
+            raise ValueError("Expected %d vectors of dimension %d, got shape %s" %
+                             (len(ids), self.dimension, vectors.shape))
+        if len(numpy.unique(ids)) != len(ids):
+            raise ValueError("Track ids must be unique within one call to add()")
+
+        existing = [track_id for track_id in ids.tolist() if track_id in self._rows]
+        if len(existing) > 0:
+            self.remove(existing)
+
+        self._reserve(self.size + len(ids))
+        rows = slice(self.size, self.size + len(ids))
+        self.vectors[rows] = vectors
+        self.ids[rows] = ids
+        if self.centroids is not None:
+            self.assignments[rows] = numpy.argmax(numpy.dot(vectors, self.centroids.T), axis=1)
+
+        for row, track_id in enumerate(ids.tolist(), self.size):
+            self._rows[track_id] = row
+
+        self.size += len(ids)
+        self._lists = None
+
+    # Remove the given track ids. The last rows are moved into the freed rows,
+    # so the matrix stays contiguous.
+    def remove(self, ids):
+        self._reserve(self.size)
+        for track_id in numpy.atleast_1d(ids).tolist():
+            row = self._rows.pop(track_id)
+            last = self.size - 1
+            if row != last:
+                self.vectors[row] = self.vectors[last]
+                self.ids[row] = self.ids[last]
+                self.assignments[row] = self.assignments[last]
+                self._rows[int(self.ids[row])] = row
+            self.size = last
+
+        self._lists = None
+
+    # Partition the index into num_lists clusters with spherical k-means.
+    # num_lists may not exceed the number of vectors trained on.
+    def train(self, num_lists, iterations=10, sample_size=100000, seed=0):
+        if self.size == 0:
+            raise ValueError("Cannot train an empty index")
+        if not 1 <= num_lists <= min(self.size, sample_size):
+            raise ValueError("num_lists must be between 1 and %d (the number of vectors trained on), got %d" %
+                             (min(self.size, sample_size), num_lists))
+
+        random = numpy.random.RandomState(seed)
+        vectors = self.vectors[:self.size]
+        sample = vectors
+        if self.size > sample_size:
+            sample = vectors[random.choice(self.size, sample_size, replace=False)]
+
+        centroids = sample[random.choice(len(sample), num_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = numpy.argmax(numpy.dot(sample, centroids.T), axis=1)
+            sums = numpy.zeros_like(centroids)
+            numpy.add.at(sums, labels, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        self.centroids = centroids
+        self._reserve(self.size)
+        for start in range(0, self.size, 65536):
+            block = vectors[start:start + 65536]
+            self.assignments[start:start + len(block)] = numpy.argmax(numpy.dot(block, centroids.T), axis=1)
+
+        self._lists = None
+
+    def _partitionLists(self):
+        if self._lists is None:
+            order = numpy.argsort(self.assignments[:self.size], kind='mergesort')
+            bounds = numpy.searchsorted(self.assignments[:self.size][order], numpy.arange(len(self.centroids) + 1))
+            self._lists = (order, bounds)
+
+        return self._lists
+
+    # Find the k most similar tracks for each query vector.
+    # Returns (ids, scores), each of shape (num_queries, k), best first. Rows are padded
+    # with id -1 and score -inf when fewer than k tracks are available.
+    # When the index is partitioned, only the num_probes nearest partitions are searched.
+    def query(self, queries, k=10, num_probes=None, block_size=65536):
+        queries = _normalize(queries)
+        num_queries = len(queries)
+        best_scores = numpy.full((num_queries, 0), -numpy.inf, dtype=numpy.float32)
+        best_rows = numpy.zeros((num_queries, 0), dtype=numpy.int64)
+
+        if self.centroids is None or num_probes is None:
+            for start in range(0, self.size, block_size):
+                block = self.vectors[start:min(start + block_size, self.size)]
+                scores = numpy.dot(queries, block.T)
+                rows = numpy.broadcast_to(numpy.arange(start, start + len(block)), scores.shape)
+                best_scores, best_rows = _mergeTopK(best_scores, best_rows, scores, rows, k)
+        else:
+            best_scores, best_rows = self._queryPartitions(queries, k, num_probes, block_size)
+
+        # Pad to k columns and sort each row by descending score
+        if best_scores.shape[1] < k:
+            padding = k - best_scores.shape[1]
+            best_scores = numpy.hstack((best_scores, numpy.full((num_queries, padding), -numpy.inf, dtype=numpy.float32)))
+            best_rows = numpy.hstack((best_rows, numpy.full((num_queries, padding), -1, dtype=numpy.int64)))
+
+        order = numpy.argsort(-best_scores, axis=1, kind='mergesort')
+        query_index = numpy.arange(num_queries)[:, None]
+        best_scores = best_scores[query_index, order]
+        best_rows = best_rows[query_index, order]
+
+        ids = numpy.where(best_rows >= 0, self.ids[numpy.maximum(best_rows, 0)], -1)
+        return ids, best_scores
+
+    def _queryPartitions(self, queries, k, num_probes, block_size):
+        order, bounds = self._partitionLists()
+        num_queries = len(queries)
+        num_probes = min(num_probes, len(self.centroids))
+
+        coarse = numpy.dot(queries, self.centroids.T)
+        probes = numpy.argpartition(-coarse, num_probes - 1, axis=1)[:, :num_probes]
+
+        # Each query keeps its own running top-k; partitions are visited once each,
+        # scoring all the queries that probe them with one matrix product.
+        best_scores = numpy.full((num_queries, k), -numpy.inf, dtype=numpy.float32)
+        best_rows = numpy.full((num_queries, k), -1, dtype=numpy.int64)
+        for partition in numpy.unique(probes):
+            query_index = numpy.flatnonzero((probes == partition).any(axis=1))
+            partition_rows = order[bounds[partition]:bounds[partition + 1]]
+            for start in range(0, len(partition_rows), block_size):
+                rows = partition_rows[start:start + block_size]
+                scores = numpy.dot(queries[query_index], self.vectors[rows].T)
+                merged_scores, merged_rows = _mergeTopK(
+                    best_scores[query_index], best_rows[query_index],
+                    scores, numpy.broadcast_to(rows, scores.shape), k)
+                best_scores[query_index] = merged_scores
+                best_rows[query_index] = merged_rows
+
+        return best_scores, best_rows
+
+    # Save the index as a directory of .npy arrays
+    def save(self, path):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        numpy.save(os.path.join(path, 'vectors.npy'), self.vectors[:self.size])
+        numpy.save(os.path.join(path, 'ids.npy'), self.ids[:self.size])
+        if self.centroids is not None:
+            numpy.save(os.path.join(path, 'centroids.npy'), self.centroids)
+            numpy.save(os.path.join(path, 'assignments.npy'), self.assignments[:self.size])
+
+    # Load an index saved with save(). With mmap=True the vector matrix is memory-mapped
+    # read-only and is only copied into memory if the index is modified.
+    @staticmethod
+    def load(path, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        vectors = numpy.load(os.path.join(path, 'vectors.npy'), mmap_mode=mmap_mode)
+
+        index = SimilarityIndex(vectors.shape[1])
+        index.vectors = vectors
+        index.ids = numpy.load(os.path.join(path, 'ids.npy'))
+        index.size = len(index.ids)
+        index.assignments = numpy.zeros(index.size, dtype=numpy.int32)
+        index._rows = dict((track_id, row) for row, track_id in enumerate(index.ids.tolist()))
+
+        centroids_path = os.path.join(path, 'centroids.npy')
+        if os.path.exists(centroids_path):
+            index.centroids = numpy.load(centroids_path)
+            index.assignments = numpy.load(os.path.join(path, 'assignments.npy'))
+
+        return index
@@ -7,32 +7,55 @@ rectify - only return positive values
 Ported from https://github.com/jsawruk/pymir: 30 August 2017
 """
 
+import numpy
 
-def spectralFlux(spectra, rectify=False):
-    spectral_flux = []
 
-    # Compute flux for zeroth spectrum
-    flux = 0
-    for nth_bin in spectra[0]:
-        flux = flux + abs(nth_bin)
+def _differences(magnitudes, rectify):
+    """
+    Differences between consecutive rows of a magnitude spectrogram; the zeroth
+    row is compared against silence. With rectify, negative differences are zeroed.
+    """
+    diff = numpy.empty_like(magnitudes)
+    diff[0] = magnitudes[0]
+    numpy.subtract(magnitudes[1:], magnitudes[:-1], out=diff[1:])
 
-        spectral_flux.append(flux)
+    # If rectify is specified, only return positive values
+    if rectify:
+        numpy.maximum(diff, 0, out=diff)
 
-    # Compute flux for subsequent spectra
-    for s in range(1, len(spectra)):
-        prev_spectrum = spectra[s - 1]
-        spectrum = spectra[s]
+    return diff
 
-        flux = 0
-        for mth_bin in range(0, len(spectrum)):
-            diff = abs(spectrum[mth_bin]) - abs(prev_spectrum[mth_bin])
 
-            # If rectify is specified, only return positive values
-            if rectify and diff < 0:
-                diff = 0
+def spectralFlux(spectra, rectify=False):
+    """
+    Compute the spectral flux of a list of spectra. As in the original loop
+    (Reference.spectralFlux), the running sum over the bins of each spectrum is
+    appended after every bin, so the result has one value per bin of every spectrum.
+    Vectorized as a cumulative sum, which adds in the same order as the loop.
+    """
+    if len(set(len(spectrum) for spectrum in spectra)) == 1:
+        magnitudes = numpy.abs(numpy.array([numpy.asarray(spectrum) for spectrum in spectra]))
+        return list(numpy.cumsum(_differences(magnitudes, rectify), axis=1).ravel())
+
+    # Spectra of different lengths (e.g. a shorter last frame): one row at a time
+    previous = numpy.abs(numpy.asarray(spectra[0]))
+    spectral_flux = list(numpy.cumsum(previous))
+    for spectrum in spectra[1:]:
+        magnitudes = numpy.abs(numpy.asarray(spectrum))
+        diff = magnitudes - previous[:len(magnitudes)]
+        if rectify:
+            numpy.maximum(diff, 0, out=diff)
+
+        spectral_flux.extend(numpy.cumsum(diff))
+        previous = magnitudes
 
-            flux = flux + diff
+    return spectral_flux
 
-            spectral_flux.append(flux)
 
-    return spectral_flux
+def spectralFluxMatrix(spectra, rectify=False):
+    """
+    Compute the spectral flux of every row of a spectrogram (num_frames, num_bins)
+    in one pass. Returns one flux value per frame; the zeroth frame is compared
+    against silence.
+    """
+    return _differences(numpy.abs(spectra), rectify).sum(axis=1)
@@ -9,7 +9,7 @@ import numpy
 import scipy.stats.mstats
 from math import sqrt
 from numpy import abs
-from pymir3x import MFCC, Pitch, Transforms
+from pymir3x import Metadata, MFCC, Pitch, Transforms
 
 
 class Spectrum(numpy.ndarray):
@@ -22,7 +22,7 @@ class Spectrum(numpy.ndarray):
         obj = numpy.ndarray.__new__(cls, shape, dtype, buffer, offset, strides,
                                     order)
 
-        obj.sampleRate = 0
+        obj.metadata = Metadata.Metadata(0)
 
         # Finally, we must return the newly created object:
         return obj
@@ -53,7 +53,18 @@ class Spectrum(numpy.ndarray):
         # InfoArray.__new__ constructor, but also with
         # arr.view(InfoArray).
 
-        self.sampleRate = getattr(obj, 'sampleRate', None)
+        # The metadata object is shared, not copied: a single lookup per new array.
+        self.metadata = getattr(obj, 'metadata', Metadata.EMPTY)
+
+    # Signal metadata, stored in one shared Metadata object (see Metadata.py)
+    sampleRate = Metadata.attribute('sampleRate')
+
+    # Keep the metadata when pickling (e.g. when sent to another process)
+    def __reduce__(self):
+        return Metadata.reduce(self)
+
+    def __setstate__(self, state):
+        Metadata.setstate(self, state)
 
     #####################
     # Spectrum methods
@@ -61,23 +72,12 @@ class Spectrum(numpy.ndarray):
 
     # Compute the spectral centroid. Characterizes the "center of gravity" of the spectrum.
     # Approximately related to timbral "brightness"
+    # Vectorized; Reference.centroid is the original loop (see Equivalence.py)
     def centroid(self):
-        bin_number = 0
-
-        numerator = 0
-        denominator = 0
-
-        for nth_bin in self:    # 'nth_bin' is used to prevent shadowing of the 'bin' keyword
-            # Compute center frequency
-            f = (self.sampleRate / 2.0) / len(self)
-            f = f * bin_number
-
-            numerator = numerator + (f * abs(nth_bin))
-            denominator = denominator + abs(nth_bin)
-
-            bin_number = bin_number + 1
+        magnitudes = abs(Metadata.plain(self))
+        frequencies = ((self.sampleRate / 2.0) / len(self)) * numpy.arange(len(self))
 
-        return (numerator * 1.0) / denominator
+        return numpy.dot(frequencies, magnitudes) / numpy.sum(magnitudes)
 
     # Compute the 12-ET chroma vector from this spectrum
     def chroma(self):
@@ -0,0 +1,244 @@
+"""
+Statistics.py
+Bounded-memory running statistics for long streams
+Frames, spectra or blocks of feature rows (one row per frame) are accumulated
+incrementally. Memory depends only on the feature dimension, never on the
+length of the stream, and partial results computed on separate chunks or in
+separate worker processes can be merged into the result of a single pass.
+
+Includes: running mean/variance, covariance and histograms
+"""
+
+import numpy
+
+
+def _asBlock(block):
+    """
+    Convert a frame, a spectrum or a block of rows into a 2-D float64 ndarray.
+    A 1-D input is treated as a single row. Complex spectra are reduced to
+    their magnitudes.
+    """
+    block = numpy.asarray(block)
+    if numpy.iscomplexobj(block):
+        block = numpy.abs(block)
+
+    if block.ndim == 1:
+        block = block.reshape(1, -1)
+    elif block.ndim != 2:
+        raise ValueError("Expected a 1-D row or a 2-D block of rows, got %d dimensions" % block.ndim)
+
+    return block.astype(numpy.float64, copy=False)
+
+
+class RunningMoments(object):
+    """
+    Running per-column mean, variance, minimum and maximum.
+    Blocks are folded in with the pairwise update of Chan et al., which
+    reduces to Welford's algorithm for single rows.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+        self.minimum = None
+        self.maximum = None
+
+    # Accumulate a single row or a block of rows
+    def update(self, block):
+        block = _asBlock(block)
+        n = block.shape[0]
+        if n == 0:
+            return self
+
+        block_mean = block.mean(axis=0)
+        centered = block - block_mean
+        block_m2 = numpy.einsum('ij,ij->j', centered, centered)
+
+        self._combine(n, block_mean, block_m2, block.min(axis=0), block.max(axis=0))
+        return self
+
+    # Fold another accumulator (e.g. from another shard) into this one
+    def merge(self, other):
+        if other.count > 0:
+            self._combine(other.count, other.mean, other.m2, other.minimum, other.maximum)
+        return self
+
+    def _combine(self, n, mean, m2, minimum, maximum):
+        if self.count == 0:
+            self.count = n
+            self.mean = numpy.array(mean, dtype=numpy.float64)
+            self.m2 = numpy.array(m2, dtype=numpy.float64)
+            self.minimum = numpy.array(minimum, dtype=numpy.float64)
+            self.maximum = numpy.array(maximum, dtype=numpy.float64)
+            return
+
+        if mean.shape != self.mean.shape:
+            raise ValueError("Cannot combine statistics of dimension %s and %s" % (self.mean.shape, mean.shape))
+
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * (n / float(total))
+        self.m2 += m2 + delta ** 2 * (self.count * n / float(total))
+        numpy.minimum(self.minimum, minimum, out=self.minimum)
+        numpy.maximum(self.maximum, maximum, out=self.maximum)
+        self.count = total
+
+    # Compute the variance, using ddof=1 for the unbiased (sample) estimate
+    def variance(self, ddof=0):
+        if self.count - ddof <= 0:
+            return None
+        return self.m2 / (self.count - ddof)
+
+    # Compute the standard deviation
+    def std(self, ddof=0):
+        variance = self.variance(ddof)
+        if variance is None:
+            return None
+        return numpy.sqrt(variance)
+
+
+class RunningCovariance(object):
+    """
+    Running mean vector and covariance matrix of the rows of a feature matrix
+    (e.g. MFCC frames).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self.comoment = None
+
+    # Accumulate a single row or a block of rows
+    def update(self, block):
+        block = _asBlock(block)
+        n = block.shape[0]
+        if n == 0:
+            return self
+
+        block_mean = block.mean(axis=0)
+        centered = block - block_mean
+        self._combine(n, block_mean, numpy.dot(centered.T, centered))
+        return self
+
+    # Fold another accumulator (e.g. from another shard) into this one
+    def merge(self, other):
+        if other.count > 0:
+            self._combine(other.count, other.mean, other.comoment)
+        return self
+
+    def _combine(self, n, mean, comoment):
+        if self.count == 0:
+            self.count = n
+            self.mean = numpy.array(mean, dtype=numpy.float64)
+            self.comoment = numpy.array(comoment, dtype=numpy.float64)
+            return
+
+        if mean.shape != self.mean.shape:
+            raise ValueError("Cannot combine statistics of dimension %s and %s" % (self.mean.shape, mean.shape))
+
+        total = self.count + n
+        delta = mean - self.mean
+        self.comoment += comoment + numpy.outer(delta, delta) * (self.count * n / float(total))
+        self.mean += delta * (n / float(total))
+        self.count = total
+
+    # Compute the covariance matrix, using ddof=1 for the unbiased (sample) estimate
+    def covariance(self, ddof=0):
+        if self.count - ddof <= 0:
+            return None
+        return self.comoment / (self.count - ddof)
+
+    # Compute the per-column variance (the diagonal of the covariance matrix)
+    def variance(self, ddof=0):
+        covariance = self.covariance(ddof)
+        if covariance is None:
+            return None
+        return numpy.diag(covariance).copy()
+
+
+class RunningHistogram(object):
+    """
+    Running per-column histograms over fixed bin edges (e.g. a chroma
+    histogram with one row of counts per pitch class). The edges are fixed up
+    front so that histograms from separate shards can be merged by addition.
+    Values outside the edges are counted in underflow/overflow.
+    """
+
+    def __init__(self, edges, dimension=1):
+        self.edges = numpy.asarray(edges, dtype=numpy.float64)
+        if self.edges.ndim != 1 or len(self.edges) < 2:
+            raise ValueError("Histogram edges must be a 1-D array with at least two values")
+        if numpy.any(numpy.diff(self.edges) <= 0):
+            raise ValueError("Histogram edges must be strictly increasing")
+
+        self.dimension = dimension
+        self.counts = numpy.zeros((dimension, len(self.edges) - 1), dtype=numpy.float64)
+        self.underflow = numpy.zeros(dimension, dtype=numpy.float64)
+        self.overflow = numpy.zeros(dimension, dtype=numpy.float64)
+
+    # Accumulate a single row or a block of rows, optionally weighting each row
+    def update(self, block, weights=None):
+        block = _asBlock(block)
+        n, dimension = block.shape
+        if n == 0:
+            return self
+        if dimension != self.dimension:
+            raise ValueError("Expected rows of dimension %d, got %d" % (self.dimension, dimension))
+
+        if weights is None:
+            weights = numpy.ones(block.shape)
+        else:
+            weights = numpy.asarray(weights, dtype=numpy.float64)
+            weights = numpy.broadcast_to(weights.reshape(n, -1) if weights.ndim == 1 else weights, block.shape)
+
+        num_bins = len(self.edges) - 1
+        index = numpy.searchsorted(self.edges, block, side='right') - 1
+
+        # The last edge is inclusive, as with numpy.histogram
+        index[block == self.edges[-1]] = num_bins - 1
+
+        below = index < 0
+        above = index >= num_bins
+        inside = ~(below | above)
+
+        columns = numpy.broadcast_to(numpy.arange(dimension), block.shape)
+        flat_index = columns[inside] * num_bins + index[inside]
+        self.counts += numpy.bincount(flat_index, weights=weights[inside],
+                                      minlength=dimension * num_bins).reshape(dimension, num_bins)
+        self.underflow += numpy.bincount(columns[below], weights=weights[below], minlength=dimension)
+        self.overflow += numpy.bincount(columns[above], weights=weights[above], minlength=dimension)
+        return self
+
+    # Fold another accumulator (e.g. from another shard) into this one
+    def merge(self, other):
+        if other.dimension != self.dimension or not numpy.array_equal(other.edges, self.edges):
+            raise ValueError("Cannot merge histograms with different edges or dimensions")
+
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    # Normalize the counts of each column so that they sum to 1
+    def density(self):
+        totals = self.counts.sum(axis=1, keepdims=True)
+        totals[totals == 0] = 1
+        return self.counts / totals
+
+
+def merge(accumulators):
+    """
+    Merge a sequence of partial accumulators of the same type (e.g. one per
+    worker or file shard) into a single accumulator.
+    The first accumulator is updated in place and returned.
+    """
+    accumulators = list(accumulators)
+    if len(accumulators) == 0:
+        return None
+
+    result = accumulators[0]
+    for accumulator in accumulators[1:]:
+        result.merge(accumulator)
+
+    return result
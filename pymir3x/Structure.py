@@ -0,0 +1,177 @@
+"""
+Structure.py
+Self-similarity and structural segmentation (verse/chorus boundaries)
+Feature matrices are (num_frames, dimension), e.g. frame-level MFCCs or the
+output of Pitch.chromaMatrix. Rows are L2-normalized, so cosine similarity is a
+dot product and blocks of the self-similarity matrix are batched matrix products.
+Nothing here materializes the full N x N matrix unless selfSimilarity() is asked
+to: tiles are produced one at a time, the lag representation keeps only a band
+of max_lag diagonals, and the checkerboard novelty curve only needs tiles
+around the main diagonal.
+"""
+
+import numpy
+import scipy.ndimage
+from numpy.lib import stride_tricks
+
+
+def normalize(features):
+    """
+    Return a float32 copy of the features with L2-normalized rows. Zero rows stay zero.
+    """
+    features = numpy.array(features, dtype=numpy.float32, ndmin=2)
+    norms = numpy.sqrt(numpy.einsum('ij,ij->i', features, features))
+    norms[norms == 0] = 1
+    features /= norms[:, None]
+    return features
+
+
+def downsample(features, factor):
+    """
+    Average every factor consecutive frames (the last group may be shorter).
+    Returns a (ceil(num_frames / factor), dimension) matrix.
+    """
+    features = numpy.asarray(features, dtype=numpy.float64)
+    if features.ndim == 1:
+        features = features[:, None]
+
+    starts = numpy.arange(0, len(features), factor)
+    sums = numpy.add.reduceat(features, starts, axis=0)
+    counts = numpy.diff(numpy.append(starts, len(features)))
+    return sums / counts[:, None]
+
+
+def tiles(features, tile_size=1024):
+    """
+    Iterate over the upper triangle of the cosine self-similarity matrix in
+    tiles of at most tile_size x tile_size. The lower triangle is the transpose.
+    Yields (row_start, column_start, tile).
+    """
+    x = normalize(features)
+    for row_start in range(0, len(x), tile_size):
+        rows = x[row_start:row_start + tile_size]
+        for column_start in range(row_start, len(x), tile_size):
+            yield row_start, column_start, numpy.dot(rows, x[column_start:column_start + tile_size].T)
+
+
+def selfSimilarity(features, tile_size=1024, out=None):
+    """
+    Compute the full cosine self-similarity matrix tile by tile. Intended for
+    short or downsampled feature sequences; out may be a preallocated array,
+    e.g. a numpy.memmap, of shape (num_frames, num_frames).
+    """
+    num_frames = len(features)
+    if out is None:
+        out = numpy.empty((num_frames, num_frames), dtype=numpy.float32)
+
+    for row_start, column_start, tile in tiles(features, tile_size):
+        out[row_start:row_start + tile.shape[0], column_start:column_start + tile.shape[1]] = tile
+        out[column_start:column_start + tile.shape[1], row_start:row_start + tile.shape[0]] = tile.T
+
+    return out
+
+
+def lagMatrix(features, max_lag, block_size=1024):
+    """
+    Compute the time-lag representation of the self-similarity matrix:
+    L[i, l] = similarity(frame i, frame i - l) for lags 0 <= l < max_lag, and 0
+    where i - l < 0. Repetitions show up as horizontal lines. Only the band of
+    max_lag diagonals is ever computed. Returns a (num_frames, max_lag) float32 matrix.
+    """
+    x = normalize(features)
+    num_frames, dimension = x.shape
+
+    # Frame j is padded row j + max_lag - 1; the zero rows give lag entries before the start
+    padded = numpy.zeros((num_frames + max_lag - 1, dimension), dtype=numpy.float32)
+    padded[max_lag - 1:] = x
+
+    lag = numpy.empty((num_frames, max_lag), dtype=numpy.float32)
+    for start in range(0, num_frames, block_size):
+        end = min(start + block_size, num_frames)
+        tile = numpy.dot(x[start:end], padded[start:end + max_lag - 1].T)
+
+        # Row r of the tile holds lags max_lag - 1 .. 0 in columns r .. r + max_lag - 1
+        band = stride_tricks.as_strided(tile, shape=(end - start, max_lag),
+                                        strides=(tile.strides[0] + tile.strides[1], tile.strides[1]))
+        lag[start:end] = band[:, ::-1]
+
+    return lag
+
+
+def checkerboardKernel(kernel_size=64, gaussian=0.5):
+    """
+    Gaussian-tapered checkerboard kernel (Foote, 2000) of kernel_size x kernel_size
+    (kernel_size is rounded down to an even number): positive on the quadrants
+    that compare frames within the past or within the future, negative on the
+    quadrants that compare past with future. gaussian is the standard deviation
+    of the taper relative to half the kernel size. The absolute values sum to 1.
+    """
+    half = kernel_size // 2
+    t = numpy.arange(-half, half) + 0.5
+    taper = numpy.exp(-0.5 * (t / (gaussian * half)) ** 2)
+    sign = numpy.sign(t)
+
+    kernel = numpy.outer(sign * taper, sign * taper)
+    return kernel / numpy.abs(kernel).sum()
+
+
+def novelty(features, kernel_size=64, block_size=1024, gaussian=0.5):
+    """
+    Compute the novelty curve: the checkerboard kernel correlated along the main
+    diagonal of the self-similarity matrix (Foote, 2000). Frame i is the centre
+    of the kernel, which covers frames i - kernel_size / 2 .. i + kernel_size / 2 - 1;
+    frames outside the signal have zero similarity. Only tiles of
+    (block_size + kernel_size) frames around the diagonal are computed.
+    Returns one value per frame.
+    """
+    kernel = checkerboardKernel(kernel_size, gaussian)
+    size = len(kernel)
+    half = size // 2
+
+    x = normalize(features)
+    num_frames, dimension = x.shape
+    padded = numpy.zeros((num_frames + size, dimension), dtype=numpy.float32)
+    padded[half:half + num_frames] = x
+
+    curve = numpy.zeros(num_frames)
+    for start in range(0, num_frames, block_size):
+        end = min(start + block_size, num_frames)
+
+        # The kernel of frame i covers padded rows i .. i + size - 1
+        rows = padded[start:end + size - 1]
+        tile = numpy.dot(rows, rows.T)
+        windows = stride_tricks.as_strided(tile, shape=(end - start, size, size),
+                                           strides=(tile.strides[0] + tile.strides[1],) + tile.strides)
+        curve[start:end] = numpy.einsum('ijk,jk->i', windows, kernel)
+
+    return curve
+
+
+def boundaries(novelty_curve, neighbourhood=16, threshold=0.1):
+    """
+    Pick segment boundaries from a novelty curve: frames that are the maximum
+    within neighbourhood frames on either side and exceed the local mean over
+    the same window by more than threshold times the curve maximum.
+    Returns an array of frame indices.
+    """
+    curve = numpy.asarray(novelty_curve, dtype=numpy.float64)
+    width = 2 * neighbourhood + 1
+    local_max = scipy.ndimage.maximum_filter1d(curve, width, mode='nearest')
+    local_mean = scipy.ndimage.uniform_filter1d(curve, width, mode='nearest')
+
+    height = threshold * max(curve.max(), 0) if len(curve) else 0
+    return numpy.flatnonzero((curve == local_max) & (curve > local_mean + height) & (curve > 0))
+
+
+def segment(features, kernel_size=64, neighbourhood=16, threshold=0.1, factor=1, block_size=1024):
+    """
+    Find structural boundaries of a feature sequence. With factor > 1 the
+    features are first averaged over groups of factor frames, and kernel_size
+    and neighbourhood are in downsampled frames.
+    Returns boundary frame indices in the original frame rate.
+    """
+    if factor > 1:
+        features = downsample(features, factor)
+
+    curve = novelty(features, kernel_size, block_size)
+    return boundaries(curve, neighbourhood, threshold) * factor
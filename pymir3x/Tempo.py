@@ -0,0 +1,170 @@
+"""
+Tempo.py
+Estimate the tempo and track beats from an onset-strength envelope
+- Onset strength: log-compressed, rectified spectral flux
+- Tempo: FFT autocorrelation of the envelope weighted by a log-normal tempo prior
+- Beats: dynamic programming beat tracker (Ellis, 2007)
+
+All stages process long inputs in fixed-size chunks, so multi-hour files
+never require a full-length spectrogram.
+"""
+
+import math
+import numpy
+
+from pymir3x import Budget, SpectralFlux, Transforms
+
+
+def onsetStrength(audio_data, frame_size=1024, hop_size=512, chunk_frames=None, log_compression=1000.0):
+    """
+    Compute the onset-strength envelope of the given audio data, one value per
+    hop. The spectrogram is computed chunk_frames frames at a time (by default
+    4096, or as many as fit in the memory budget; see Budget).
+    Returns (envelope, frame_rate) where frame_rate is in frames per second.
+    """
+    if chunk_frames is None:
+        chunk_frames = Budget.stftChunkFrames(frame_size, 4096)
+
+    samples = numpy.asarray(audio_data)
+    num_frames = max(1, 1 + (len(samples) - frame_size) // hop_size)
+    envelope = numpy.zeros(num_frames)
+    previous = None
+
+    for start in range(0, num_frames, chunk_frames):
+        end = min(start + chunk_frames, num_frames)
+        chunk = samples[start * hop_size:(end - 1) * hop_size + frame_size]
+        magnitudes = numpy.abs(Transforms.stft(chunk, frame_size, hop_size))
+        if log_compression:
+            magnitudes = numpy.log1p(log_compression * magnitudes)
+
+        # Carry the last spectrum over so that chunk boundaries are seamless
+        if previous is None:
+            flux = SpectralFlux.spectralFluxMatrix(magnitudes, rectify=True)
+            flux[0] = 0
+        else:
+            flux = SpectralFlux.spectralFluxMatrix(numpy.vstack((previous, magnitudes)), rectify=True)[1:]
+
+        envelope[start:end] = flux
+        previous = magnitudes[-1:]
+
+    return envelope, audio_data.sampleRate / float(hop_size)
+
+
+def autocorrelation(envelope, max_lag, chunk_size=65536):
+    """
+    Compute the autocorrelation r(lag) = sum(e[i] * e[i + lag]) for lag = 0..max_lag
+    with FFTs over chunks of the envelope. Each chunk is correlated against
+    itself extended by max_lag samples, so the sum over chunks is exact.
+    """
+    envelope = numpy.asarray(envelope, dtype=numpy.float64)
+    max_lag = min(max_lag, len(envelope) - 1)
+    chunk_size = max(chunk_size, max_lag + 1)
+
+    fft_size = 1
+    while fft_size < chunk_size + 2 * max_lag + 1:
+        fft_size *= 2
+
+    result = numpy.zeros(max_lag + 1)
+    for start in range(0, len(envelope), chunk_size):
+        chunk = envelope[start:start + chunk_size]
+        extended = envelope[start:start + chunk_size + max_lag]
+        correlation = numpy.fft.irfft(numpy.conj(numpy.fft.rfft(chunk, fft_size)) * numpy.fft.rfft(extended, fft_size),
+                                      fft_size)
+        result += correlation[:max_lag + 1]
+
+    return result
+
+
+def tempo(envelope, frame_rate, min_bpm=30.0, max_bpm=300.0, prior_bpm=120.0, prior_width=1.0):
+    """
+    Estimate the global tempo in beats per minute from an onset-strength envelope.
+    The autocorrelation is weighted by a log-normal prior centred on prior_bpm
+    with a standard deviation of prior_width octaves; prior_width=None disables it.
+    """
+    envelope = numpy.asarray(envelope, dtype=numpy.float64)
+    envelope = envelope - envelope.mean()
+
+    min_lag = max(1, int(math.floor(60.0 * frame_rate / max_bpm)))
+    max_lag = int(math.ceil(60.0 * frame_rate / min_bpm))
+    if len(envelope) <= min_lag + 1:
+        return 0.0
+
+    correlation = autocorrelation(envelope, max_lag + 1)
+    max_lag = min(max_lag, len(correlation) - 2)
+
+    lags = numpy.arange(min_lag, max_lag + 1)
+    bpm = 60.0 * frame_rate / lags
+    weighted = correlation[lags]
+    if prior_width is not None:
+        weighted = weighted * numpy.exp(-0.5 * (numpy.log2(bpm / prior_bpm) / prior_width) ** 2)
+
+    best = int(numpy.argmax(weighted))
+    lag = float(lags[best])
+
+    # Parabolic interpolation of the (unweighted) autocorrelation peak
+    if 0 < best < len(lags) - 1:
+        left, centre, right = correlation[lags[best] - 1:lags[best] + 2]
+        denominator = left - 2 * centre + right
+        if denominator < 0:
+            lag += 0.5 * (left - right) / denominator
+
+    return 60.0 * frame_rate / lag
+
+
+def beatTrack(envelope, frame_rate, bpm=None, tightness=100.0):
+    """
+    Track beats through an onset-strength envelope by dynamic programming.
+    Every frame t gets a cumulative score: its local onset strength plus the best
+    score of a predecessor between 2 and 0.5 beat periods earlier, penalized by the
+    squared log deviation of the interval from the period. Since every predecessor
+    lies at least half a period back, a whole half-period block of frames is scored
+    in one vectorized step.
+    Returns (beat_frames, beat_times); both are empty for a constant envelope.
+    """
+    envelope = numpy.asarray(envelope, dtype=numpy.float64)
+    if bpm is None:
+        bpm = tempo(envelope, frame_rate)
+
+    # A constant envelope (silence, or a DC-only chunk) has no onsets to track
+    if len(envelope) == 0 or bpm <= 0 or envelope.std() == 0:
+        return numpy.array([], dtype=int), numpy.array([])
+
+    period = 60.0 * frame_rate / bpm
+
+    # Smooth the normalized envelope with a Gaussian a fraction of a period wide
+    envelope = envelope / envelope.std()
+    offsets = numpy.arange(-int(period), int(period) + 1)
+    kernel = numpy.exp(-0.5 * (offsets * 32.0 / period) ** 2)
+    local_score = numpy.convolve(envelope, kernel, 'same')
+
+    lags = numpy.arange(max(1, int(round(period / 2))), int(round(2 * period)) + 1)
+    penalty = -tightness * numpy.log(lags / period) ** 2
+    block_size = lags[0]
+
+    num_frames = len(local_score)
+    cumulative_score = numpy.zeros(num_frames)
+    backlink = numpy.full(num_frames, -1, dtype=int)
+
+    for start in range(0, num_frames, block_size):
+        frames = numpy.arange(start, min(start + block_size, num_frames))
+        predecessors = frames[:, None] - lags[None, :]
+        valid = predecessors >= 0
+
+        scores = numpy.where(valid, cumulative_score[numpy.maximum(predecessors, 0)] + penalty, -numpy.inf)
+        best = numpy.argmax(scores, axis=1)
+        best_score = scores[numpy.arange(len(frames)), best]
+        has_predecessor = valid.any(axis=1) & (best_score > 0)
+
+        cumulative_score[frames] = local_score[frames] + numpy.where(has_predecessor, best_score, 0)
+        backlink[frames] = numpy.where(has_predecessor, predecessors[numpy.arange(len(frames)), best], -1)
+
+    # Start from the best-scoring frame within the last period and follow the backlinks
+    tail = max(0, num_frames - int(math.ceil(period)))
+    beat = tail + int(numpy.argmax(cumulative_score[tail:]))
+    beats = []
+    while beat >= 0:
+        beats.append(beat)
+        beat = backlink[beat]
+
+    beat_frames = numpy.array(beats[::-1], dtype=int)
+    return beat_frames, beat_frames / float(frame_rate)
@@ -1,15 +1,18 @@
 """
 Transforms for converting between time and spectral domains
-Includes: FFT/IFFT, DCT/IDCT, CQT
+Includes: FFT/IFFT, STFT/ISTFT, DCT/IDCT, CQT
 Ported from https://github.com/jsawruk/pymir: 29 August 2017
 """
 
 import numpy
 import numpy.fft
+import pyaudio
 import scipy.fftpack
 import pymir3x
 
+from pymir3x import Budget, Metadata
 from numpy import array, cos, pi, sqrt, zeros
+from numpy.lib import stride_tricks
 
 
 # Fourier Transforms
@@ -18,48 +21,198 @@ def fft(frame):
     Compute the spectrum using an FFT.
     Returns an instance of the spectrum.
     """
-    fft_data = numpy.fft.rfft(frame)  # rfft only returns the real half of the FFT values, which is all we need.
-    spectrum = fft_data.view(pymir3x.Spectrum)
-    spectrum.sampleRate = frame.sampleRate
-    return spectrum
+    fft_data = numpy.fft.rfft(Metadata.plain(frame))  # rfft only returns the real half of the FFT values, which is all we need.
+    return Metadata.wrap(fft_data, pymir3x.Spectrum, frame.metadata)
 
 
 # Inverse Fourier Transform
 def ifft(spectrum):
-    fft_data = numpy.fft.irfft(spectrum)
-    frame = fft_data.view(pymir3x.Frame)
-    frame.sampleRate = spectrum.sampleRate
-    return frame
+    fft_data = numpy.fft.irfft(Metadata.plain(spectrum))
+    return Metadata.wrap(fft_data, pymir3x.Frame, spectrum.metadata)
+
+
+# Frame matrix
+def frameMatrix(frame, frame_size, hop_size):
+    """
+    Return a (num_frames, frame_size) view of the signal with one analysis
+    frame per row, starting every hop_size samples. Frames that would run past
+    the end of the signal are dropped; a signal shorter than frame_size is zero
+    padded to a single frame.
+    The rows overlap in memory, so the view is read-only.
+    """
+    samples = numpy.ascontiguousarray(frame)
+    if len(samples) < frame_size:
+        samples = numpy.append(samples, numpy.zeros(frame_size - len(samples), dtype=samples.dtype))
+
+    num_frames = 1 + (len(samples) - frame_size) // hop_size
+    return stride_tricks.as_strided(samples, shape=(num_frames, frame_size),
+                                    strides=(hop_size * samples.itemsize, samples.itemsize), writeable=False)
+
+
+# Short-Time Fourier Transform
+def stft(frame, frame_size=1024, hop_size=512, window_function=numpy.hanning):
+    """
+    Compute the spectra of all frames of the signal with a single batched rfft.
+    Returns a complex (num_frames, frame_size // 2 + 1) ndarray, one spectrum per row.
+    Under a memory budget (see Budget) the frames are transformed in chunks.
+    """
+    frames = frameMatrix(frame, frame_size, hop_size)
+    window = window_function(frame_size) if window_function is not None else None
+
+    # Under a memory budget, window and transform the frames a chunk at a time
+    chunk = Budget.stftChunkFrames(frame_size, len(frames))
+    spectra = None
+    for start in range(0, len(frames), chunk):
+        block = frames[start:start + chunk]
+        if window is not None:
+            block = block * window
+
+        block_spectra = numpy.fft.rfft(block, axis=1)
+        if chunk >= len(frames):
+            return block_spectra
+
+        if spectra is None:
+            spectra = numpy.empty((len(frames), block_spectra.shape[1]), dtype=block_spectra.dtype)
+        spectra[start:start + chunk] = block_spectra
+
+    return spectra
+
+
+# Overlap-add
+def overlapAdd(frames, hop_size, output, first_frame=0):
+    """
+    Add time-domain frames (num_frames, frame_size) into output in place, with
+    frame i starting at sample (first_frame + i) * hop_size.
+    """
+    num_frames, frame_size = frames.shape
+    start = first_frame * hop_size
+    if frame_size % hop_size == 0:
+        # Every frame is a whole number of hops: add one hop-sized column of all frames at a time
+        for r in range(frame_size // hop_size):
+            segment = output[start + r * hop_size:start + (r + num_frames) * hop_size]
+            segment += frames[:, r * hop_size:(r + 1) * hop_size].ravel()
+    else:
+        positions = start + numpy.arange(num_frames)[:, None] * hop_size + numpy.arange(frame_size)[None, :]
+        numpy.add.at(output, positions, frames)
+
+
+# Inverse Short-Time Fourier Transform
+def istft(spectra, frame_size=None, hop_size=512, window_function=numpy.hanning, sample_rate=None):
+    """
+    Resynthesize a signal from a spectrogram (num_frames, num_bins), e.g. the
+    output of stft(), with one batched irfft and weighted overlap-add.
+    The overlapping squared windows are divided out; samples where they sum to
+    zero (e.g. the first sample under a Hann window) are left at 0.
+    Returns a Frame of (num_frames - 1) * hop_size + frame_size samples.
+    """
+    spectra = numpy.asarray(spectra)
+    if frame_size is None:
+        frame_size = 2 * (spectra.shape[1] - 1)
+    window = numpy.ones(frame_size) if window_function is None else window_function(frame_size)
+
+    length = (len(spectra) - 1) * hop_size + frame_size
+    signal = numpy.zeros(length)
+    overlapAdd(numpy.fft.irfft(spectra, frame_size, axis=1) * window, hop_size, signal)
+
+    window_sum = numpy.zeros(length)
+    overlapAdd(numpy.tile(window ** 2, (len(spectra), 1)), hop_size, window_sum)
+    nonzero = window_sum > 1e-10
+    signal[nonzero] /= window_sum[nonzero]
+
+    return Metadata.wrap(signal, pymir3x.Frame, Metadata.Metadata(sample_rate, 1, pyaudio.paFloat32))
+
+
+class StreamingISTFT(object):
+    """
+    Incremental istft(): spectra are passed in blocks as they arrive, and every
+    call returns the samples that no later frame can change. The concatenated
+    output of process() and flush() equals istft() of all the spectra.
+    """
+
+    def __init__(self, frame_size, hop_size=512, window_function=numpy.hanning, sample_rate=None):
+        self.frame_size = frame_size
+        self.hop_size = hop_size
+        self.window = numpy.ones(frame_size) if window_function is None else window_function(frame_size)
+        self.metadata = Metadata.Metadata(sample_rate, 1, pyaudio.paFloat32)
+        self._signal = numpy.zeros(0)
+        self._window_sum = numpy.zeros(0)
+
+    def _emit(self, count):
+        signal = self._signal[:count]
+        window_sum = self._window_sum[:count]
+        nonzero = window_sum > 1e-10
+        signal[nonzero] /= window_sum[nonzero]
+
+        self._signal = self._signal[count:]
+        self._window_sum = self._window_sum[count:]
+        return Metadata.wrap(signal, pymir3x.Frame, self.metadata)
+
+    # Add a block of spectra (num_frames, num_bins) and return the finished output samples
+    def process(self, spectra):
+        spectra = numpy.atleast_2d(spectra)
+        num_frames = len(spectra)
+        if num_frames == 0:
+            return Metadata.wrap(numpy.zeros(0), pymir3x.Frame, self.metadata)
+
+        # The pending tail (frame_size - hop_size samples) is extended to cover the new frames
+        length = (num_frames - 1) * self.hop_size + self.frame_size
+        signal = numpy.zeros(length)
+        window_sum = numpy.zeros(length)
+        signal[:len(self._signal)] = self._signal
+        window_sum[:len(self._window_sum)] = self._window_sum
+
+        overlapAdd(numpy.fft.irfft(spectra, self.frame_size, axis=1) * self.window, self.hop_size, signal)
+        overlapAdd(numpy.tile(self.window ** 2, (num_frames, 1)), self.hop_size, window_sum)
+        self._signal = signal
+        self._window_sum = window_sum
+
+        return self._emit(num_frames * self.hop_size)
+
+    # Return the remaining output after the last frame
+    def flush(self):
+        return self._emit(len(self._signal))
 
 
 # Discrete Cosine Transform (DCT)
 def dct(frame):
-    dct_result = scipy.fftpack.dct(frame, type=2, norm='ortho')
-    dct_spectrum = dct_result.view(pymir3x.Spectrum)
-    dct_spectrum.sampleRate = frame.sampleRate
-    return dct_spectrum
+    dct_result = scipy.fftpack.dct(Metadata.plain(frame), type=2, norm='ortho')
+    return Metadata.wrap(dct_result, pymir3x.Spectrum, frame.metadata)
 
 
 # Inverse Discrete Cosine Transform (IDCT)
 def idct(spectrum):
-    idct_result = scipy.fftpack.idct(spectrum, type=2, norm='ortho')
-    idct_frame = idct_result.view(pymir3x.Frame)
-    idct_frame.sampleRate = spectrum.sampleRate
-    return idct_frame
+    idct_result = scipy.fftpack.idct(Metadata.plain(spectrum), type=2, norm='ortho')
+    return Metadata.wrap(idct_result, pymir3x.Frame, spectrum.metadata)
 
 
 # Constant Q Transform
 def cqt(frame):
-    frame_length = len(frame)
+    """
+    Vectorized replica of the original loop (Reference.cqt), which rescales the
+    running sum inside its inner loop, so that
+    y[k] = sum_n frame[n] * cos(pi * (2n + 1) * k / 2N) * s_k ** (N - n)
+    with s_0 = sqrt(1 / N) and s_k = sqrt(2 / N) otherwise. Terms whose weight
+    underflows to zero are skipped; rows are computed in blocks.
+    """
+    samples = numpy.asarray(frame)
+    frame_length = len(samples)
     y = array(zeros(frame_length))
-    a = sqrt(2 / float(frame_length))
-    for k in range(frame_length):
-        for n in range(frame_length):
-            y[k] += frame[n] * cos(pi * (2 * n + 1) * k / float(2 * frame_length))
-
-            if k == 0:
-                y[k] = y[k] * sqrt(1 / float(frame_length))
-            else:
-                y[k] = y[k] * a
+    n = numpy.arange(frame_length)
+
+    for first_row, last_row, scale in ((0, 1, sqrt(1 / float(frame_length))), (1, frame_length, sqrt(2 / float(frame_length)))):
+        if last_row <= first_row:
+            continue
+
+        weights = scale ** (frame_length - n)
+        nonzero = numpy.flatnonzero(weights)
+        if len(nonzero) == 0:
+            continue
+
+        columns = n[nonzero[0]:]
+        weighted = samples[nonzero[0]:] * weights[nonzero[0]:]
+        block = max(1, 2 ** 20 // len(columns))
+        for start in range(first_row, last_row, block):
+            k = numpy.arange(start, min(start + block, last_row))
+            y[k] = numpy.dot(cos(pi * (2 * columns + 1) * k[:, None] / float(2 * frame_length)), weighted)
 
     return y
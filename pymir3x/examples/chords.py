@@ -23,27 +23,19 @@ print("Finding onsets using Spectral Flux (spectral domain)")
 o = Onsets.onsetsByFlux(audio_file)
 print(o)
 
-print("Extracting Frames")
-frames = audio_file.framesFromOnsets(o)
+print("Extracting Segments")
+segments = audio_file.segmentsFromOnsets(o)
+
+# Chroma of every segment, computed in one pass over the file
+chroma = segments.chroma()
+startTimes, endTimes = segments.times()
 
 print("Start | End  | Chord | (% match)")
 print("-------------------------------")
 
-frameIndex = 0
-startIndex = 0
-for frame in frames:
-    spectrum = frame.spectrum()
-    chroma = spectrum.chroma()
-    print(chroma)
-
-    chord, score = Pitch.getChord(chroma)
-
-    endIndex = startIndex + len(frame)
-
-    startTime = startIndex / frame.sampleRate
-    endTime = endIndex / frame.sampleRate
+for i in range(len(segments)):
+    print(chroma[i])
 
-    print("%.2f  | %.2f | %-4s | (%.2f)" % (startTime, endTime, chord, score))
+    chord, score = Pitch.getChord(chroma[i])
 
-    frameIndex = frameIndex + 1
-    startIndex = startIndex + len(frame)
+    print("%.2f  | %.2f | %-4s | (%.2f)" % (startTimes[i], endTimes[i], chord, score))
@@ -0,0 +1,54 @@
+"""
+fingerprint_benchmark.py
+Measure insertion and lookup throughput of the fingerprint index at catalogue scale
+using synthetic hashes, then check that an excerpt of a real file is identified.
+"""
+
+import sys
+import time
+import numpy
+
+from pymir3x import AudioFile, Fingerprint
+
+sys.path.append('..')
+
+num_tracks = 20000
+hashes_per_track = 2000
+num_queries = 100
+query_length = 500
+
+random = numpy.random.RandomState(0)
+
+print("Inserting %d tracks x %d hashes" % (num_tracks, hashes_per_track))
+index = Fingerprint.FingerprintIndex()
+start = time.time()
+for track_id in range(num_tracks):
+    track_hashes = random.randint(0, 2 ** 26, hashes_per_track).astype(numpy.uint32)
+    anchor_frames = numpy.sort(random.randint(0, 20000, hashes_per_track)).astype(numpy.uint32)
+    index.add(track_id, track_hashes, anchor_frames)
+index.commit()
+elapsed = time.time() - start
+print("  %.2f s, %.0f hashes/s" % (elapsed, len(index) / elapsed))
+
+print("Querying %d excerpts of %d hashes" % (num_queries, query_length))
+queries = []
+for _ in range(num_queries):
+    track_id = random.randint(num_tracks)
+    positions = numpy.flatnonzero(index.tracks == track_id)[:query_length]
+    query_frames = index.offsets[positions].astype(numpy.int64) - 100
+    queries.append((track_id, index.hashes[positions], query_frames))
+
+start = time.time()
+correct = 0
+for track_id, query_hashes, query_frames in queries:
+    results = index.query(query_hashes, query_frames, top=1)
+    correct += int(results[0][0] == track_id)
+elapsed = time.time() - start
+print("  %.2f ms/query, %d/%d identified" % (1000 * elapsed / num_queries, correct, num_queries))
+
+print("Identifying an excerpt of a real file")
+audio_file = AudioFile.open("../audio_files/drum_loop_01.wav")
+file_index = Fingerprint.FingerprintIndex()
+file_index.addAudio(1, audio_file)
+excerpt = audio_file[len(audio_file) // 4:len(audio_file) // 2]
+print(file_index.queryAudio(excerpt))
@@ -0,0 +1,55 @@
+"""
+metadata_benchmark.py
+Per-operation overhead of the Frame subclass on small frames:
+attribute-copying metadata (the previous implementation, reproduced here as
+LegacyFrame) versus the shared Metadata object, with plain ndarrays as the baseline.
+"""
+
+import sys
+import timeit
+import numpy
+
+from pymir3x import Frame, Metadata
+
+sys.path.append('..')
+
+
+class LegacyFrame(numpy.ndarray):
+    def __array_finalize__(self, obj):
+        if obj is None:
+            return
+        self.sampleRate = getattr(obj, 'sampleRate', None)
+        self.channels = getattr(obj, 'channels', None)
+        self.format = getattr(obj, 'format', None)
+
+
+samples = numpy.random.RandomState(0).randn(1024)
+
+legacy = samples.view(LegacyFrame)
+legacy.sampleRate = 44100
+legacy.channels = 1
+legacy.format = 1
+
+frame = Metadata.wrap(samples, Frame, Metadata.Metadata(44100, 1, 1))
+
+operations = [
+    ("slice", lambda x: x[16:528]),
+    ("ufunc", lambda x: numpy.abs(x)),
+    ("arithmetic", lambda x: x * 0.5 + 1.0),
+    ("view", lambda x: x.view(type(x))),
+]
+
+number = 200000
+print("%-12s %10s %10s %10s" % ("operation", "ndarray", "legacy", "metadata"))
+for name, operation in operations:
+    timings = []
+    for x in (samples, legacy, frame):
+        seconds = min(timeit.repeat(lambda: operation(x), number=number, repeat=3))
+        timings.append(1e9 * seconds / number)
+    print("%-12s %8.0f ns %8.0f ns %8.0f ns" % ((name,) + tuple(timings)))
+
+number = 20
+print("frames(64) on 1 s of audio:")
+signal = Metadata.wrap(numpy.random.RandomState(1).randn(44100), Frame, Metadata.Metadata(44100, 1, 1))
+seconds = min(timeit.repeat(lambda: signal.frames(64, numpy.hamming), number=number, repeat=3))
+print("  %.2f ms" % (1000 * seconds / number))